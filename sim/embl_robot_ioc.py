@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""Simulated EMBL sample-changer robot for running robot code offline.
+
+Serves the PVs used by Robot in startup/26-robot.py:
+
+- a put of [command, timeout] to startRobotTask is acknowledged after
+  SIM:AckTime seconds by incrementing the counter in element 0 of the
+  startRobotTask readback;
+- the task then runs: State goes to "Running" and back to "Idle",
+  isTaskRunning follows, and LastTaskInfo is [name, args, start, end,
+  result, exception] with end "null" while running. LastTaskException,
+  LastTaskOutput and checkTaskResult repeat the outcome;
+- Load/Mount/Unmount/Unload (and their Special variants) move the sample
+  between dewar, gripper and goniometer; they and TraceSample report the
+  sample state as "Done <mounted>/<loaded>/<tilted>", isSampleMounted
+  follows;
+- a put to pauseRobot holds the running task (State "Paused") until a
+  put to resumeRobot; a put to abort ends it with "ABORT: ...";
+- a put of [name, value, timeout] to setRobotVariable sets a robot
+  variable, a put of a name to getRobotVariable is answered after
+  SIM:AckTime seconds with the variable's value.
+
+Task durations are SIM:TaskTime seconds times the command's units
+(TASK_TIMES, changed with a put of [command, units] to SIM:TaskUnits),
+times a log-normal factor of median 1 and sigma SIM:TaskJitter.
+
+Faults (FAULTS) are injected with a put of [command, fault] to SIM:Fault,
+which makes the next run of that command fail that way, or at random with
+probability SIM:FaultRate per task (a random fault that applies to the
+command). SIM:Seed reseeds the random draws. A put to SIM:ClearSample
+puts any pin back in the dewar, as an operator would after a failure.
+
+The PVs are served under SIM_PREFIX by default. Serving the beamline names
+(PRODUCTION_PREFIX, which a live robot IOC may already be serving) takes
+an explicit --production-prefix; --prefix refuses them:
+
+    python sim/embl_robot_ioc.py --list-pvs
+    python sim/embl_robot_ioc.py --production-prefix --list-pvs
+"""
+import asyncio
+import time
+
+import numpy as np
+from caproto import ChannelType
+from caproto.server import PVGroup, pvproperty, run, template_arg_parser
+
+SIM_PREFIX = "SIM:AMX{EMBL}:"
+PRODUCTION_PREFIX = "XF:17IDB-ES:AMX{EMBL}:"
+
+# duration of each command, in units of SIM:TaskTime
+TASK_TIMES = {
+    "Initialize": 0.5, "Home": 1, "Park": 1, "Finish": 0.5,
+    "LatchRobGov": 0.2, "UnlatchRobGov": 0.2, "TraceSample": 0.5,
+    "CoolDown": 2, "WarmUp": 2, "Load": 3, "Mount": 2, "Unmount": 2,
+    "Unload": 3, "ClosePorts": 0.5, "LoadSpecial": 3, "MountSpecial": 2,
+    "UnmountSpecial": 2, "UnloadSpecial": 3,
+}
+
+TASK_INFO = 6
+
+# robot variables at startup
+VARIABLES = {"nSample": "1", "nDummy": "882"}
+
+# (mounted, loaded) after each sample-moving command
+SAMPLE_MOVES = {
+    "Load": (False, True), "Mount": (True, False),
+    "Unmount": (False, True), "Unload": (False, False),
+    "LoadSpecial": (False, True), "MountSpecial": (True, False),
+    "UnmountSpecial": (False, True), "UnloadSpecial": (False, False),
+}
+
+_LOADS = ("Load", "LoadSpecial")
+_MOUNTS = ("Mount", "MountSpecial")
+_UNMOUNTS = ("Unmount", "UnmountSpecial")
+
+# fault: (commands it applies to, None for all; what happens)
+FAULTS = {
+    "abort": (None, "the task ends with ABORT"),
+    "error": (None, "the task ends with an error and an exception"),
+    "hang": (None, "the task runs until aborted"),
+    "se_timeout": (_MOUNTS, "the governor is not in SE, the pin stays in "
+                            "the gripper"),
+    "no_load": (_LOADS, "no pin is picked up"),
+    "tilted": (_LOADS, "the pin is tilted in the gripper"),
+    "mount_fail": (_MOUNTS, "the pin stays in the gripper"),
+    "lost": (_MOUNTS + _UNMOUNTS, "the pin is lost"),
+    "sticky": (_UNMOUNTS, "the pin stays on the goniometer"),
+}
+
+
+def _strings(name, n, value=""):
+    return pvproperty(name=name, value=[value] * n,
+                      dtype=ChannelType.STRING, max_length=n)
+
+
+def _string(name, value="", **kwargs):
+    return pvproperty(name=name, value=value, dtype=ChannelType.STRING,
+                      **kwargs)
+
+
+class EMBLRobotIOC(PVGroup):
+    """EMBL robot with simulated task timing, sample state and faults."""
+
+    task = _strings("startRobotTask", 2, "0")
+    abort = _string("abort")
+    restart = _string("restart")
+    robot_pause = _string("pauseRobot")
+    robot_resume = _string("resumeRobot")
+    start_test = _string("startTestTask")
+
+    set_variable = _strings("setRobotVariable", 3)
+    get_variable = _string("getRobotVariable")
+    speed = pvproperty(name="RobotSpeed", value=100)
+    gui_lockout = pvproperty(name="LocalGuiLockOut", value=0)
+
+    status = _string("Status", "OK", read_only=True)
+    robot_state = _string("RobotState", "Idle", read_only=True)
+    state = _string("State", "Idle", read_only=True)
+    info = _string("getTaskInfo", read_only=True)
+    running = pvproperty(name="isTaskRunning", value=0, read_only=True)
+    distance = pvproperty(name="getDistance", value=0.0, read_only=True)
+    sample_mounted = pvproperty(name="isSampleMounted", value=0,
+                                read_only=True)
+    check_result = _string("checkTaskResult", read_only=True)
+    task_exception = _string("LastTaskException", read_only=True)
+    task_output = _string("LastTaskOutput", read_only=True)
+    task_info = _strings("LastTaskInfo", TASK_INFO, "null")
+    cartesian_positions = pvproperty(name="CartesianPositions",
+                                     value=[0.0] * 6, read_only=True)
+    joint_positions = pvproperty(name="JointPositions", value=[0.0] * 6,
+                                 read_only=True)
+    version = _string("Version", "sim", read_only=True)
+    uptime = pvproperty(name="Uptime", value=0, read_only=True)
+    alarm_list = _strings("AlarmList", 4)
+
+    ack_time = pvproperty(name="SIM:AckTime", value=0.02,
+                          doc="seconds until a task put is acknowledged")
+    task_time = pvproperty(name="SIM:TaskTime", value=0.2,
+                           doc="seconds per unit of TASK_TIMES")
+    task_jitter = pvproperty(name="SIM:TaskJitter", value=0.0,
+                             doc="sigma of the log-normal duration factor")
+    task_units = _strings("SIM:TaskUnits", 2)
+    fault = _strings("SIM:Fault", 2)
+    fault_rate = pvproperty(name="SIM:FaultRate", value=0.0,
+                            doc="probability of a random fault per task")
+    seed = pvproperty(name="SIM:Seed", value=0)
+    clear_sample = pvproperty(name="SIM:ClearSample", value=0)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._counter = 0
+        self._task = None
+        self.variables = dict(VARIABLES)
+        self.task_times = dict(TASK_TIMES)
+        # command: faults queued for its next runs
+        self.faults = {}
+        self.rng = np.random.default_rng(0)
+        self.mounted = self.loaded = self.tilted = False
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+        self._started = time.monotonic()
+
+    @task.putter
+    async def task(self, instance, value):
+        command = value[0]
+        timeout = value[1] if len(value) > 1 else "-1"
+        if self._task is not None and not self._task.done():
+            raise RuntimeError(f"task {command} refused, a task is running")
+        self._task = asyncio.ensure_future(self._run(command, timeout))
+        return [str(self._counter), timeout]
+
+    @abort.putter
+    async def abort(self, instance, value):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    @restart.putter
+    async def restart(self, instance, value):
+        await self.abort.write(value)
+        self._resumed.set()
+
+    @robot_pause.putter
+    async def robot_pause(self, instance, value):
+        self._resumed.clear()
+        if self.running.value:
+            await self.state.write("Paused")
+
+    @robot_resume.putter
+    async def robot_resume(self, instance, value):
+        self._resumed.set()
+        if self.running.value:
+            await self.state.write("Running")
+
+    @set_variable.putter
+    async def set_variable(self, instance, value):
+        self.variables[value[0]] = value[1]
+
+    @get_variable.putter
+    async def get_variable(self, instance, value):
+        asyncio.ensure_future(self._answer(value))
+        return value
+
+    async def _answer(self, name):
+        await asyncio.sleep(self.ack_time.value)
+        await self.get_variable.write(self.variables.get(name, "null"),
+                                      verify_value=False)
+
+    @task_units.putter
+    async def task_units(self, instance, value):
+        self.task_times[value[0]] = float(value[1])
+
+    @fault.putter
+    async def fault(self, instance, value):
+        command, fault = value[0], value[1]
+        commands = FAULTS[fault][0]
+        if commands is not None and command not in commands:
+            raise ValueError(f"fault {fault} does not apply to {command}")
+        self.faults.setdefault(command, []).append(fault)
+
+    @seed.putter
+    async def seed(self, instance, value):
+        self.rng = np.random.default_rng(value)
+
+    @clear_sample.putter
+    async def clear_sample(self, instance, value):
+        self.mounted = self.loaded = self.tilted = False
+        await self.sample_mounted.write(0)
+
+    @uptime.startup
+    async def uptime(self, instance, async_lib):
+        while True:
+            await instance.write(int(time.monotonic() - self._started))
+            await async_lib.library.sleep(1)
+
+    async def _work(self, duration):
+        """Sleep `duration` seconds of task time, not counting pauses."""
+        end = time.monotonic() + duration
+        while end > time.monotonic():
+            await asyncio.sleep(min(end - time.monotonic(), 0.01))
+            if not self._resumed.is_set():
+                paused = time.monotonic()
+                await self._resumed.wait()
+                end += time.monotonic() - paused
+
+    def duration(self, command):
+        """Seconds the next run of `command` takes."""
+        duration = self.task_time.value * self.task_times.get(command, 1)
+        if self.task_jitter.value > 0:
+            duration *= self.rng.lognormal(0, self.task_jitter.value)
+        return duration
+
+    def next_fault(self, command):
+        """Fault for this run of `command`: queued, random or None."""
+        if self.faults.get(command):
+            return self.faults[command].pop(0)
+        if self.fault_rate.value > 0 and (
+                self.rng.random() < self.fault_rate.value):
+            faults = [fault for fault, (commands, _) in FAULTS.items()
+                      if fault != "hang"
+                      and (commands is None or command in commands)]
+            return str(self.rng.choice(faults))
+        return None
+
+    async def _run(self, command, timeout):
+        await asyncio.sleep(self.ack_time.value)
+        self._counter += 1
+        # verify_value=False: update the readback without the putter
+        await self.task.write([str(self._counter), timeout],
+                              verify_value=False)
+        start = time.strftime("%H:%M:%S")
+        await self.task_info.write(
+            [command, timeout, start, "null", "Running", ""])
+        await self.running.write(1)
+        await self.state.write("Running")
+        await self.robot_state.write("Moving")
+
+        fault = self.next_fault(command)
+        try:
+            if fault == "hang":
+                await asyncio.Event().wait()
+            await self._work(self.duration(command))
+            result, exception = self.result(command, fault)
+        except asyncio.CancelledError:
+            result, exception = "ABORT: Task aborted", ""
+
+        await self.task_info.write(
+            [command, timeout, start, f"{time.time():.6f}", result,
+             exception])
+        await self.task_exception.write(exception)
+        await self.task_output.write(result)
+        await self.check_result.write(result.split(" ")[0])
+        await self.sample_mounted.write(int(self.mounted))
+        await self.running.write(0)
+        await self.state.write("Idle")
+        await self.robot_state.write("Idle")
+
+    def result(self, command, fault=None):
+        """(result, exception) reported in LastTaskInfo for a command,
+        updating the sample state."""
+        if fault == "abort":
+            return f"ABORT: Simulated {command} abort", ""
+        if fault == "error":
+            return "Error", f"Simulated {command} error"
+        if command in SAMPLE_MOVES:
+            self.mounted, self.loaded = SAMPLE_MOVES[command]
+            if command in _LOADS:
+                self.tilted = fault == "tilted"
+                self.loaded = fault != "no_load"
+            elif fault in ("se_timeout", "mount_fail"):
+                self.mounted, self.loaded = False, True
+            elif fault == "sticky":
+                self.mounted, self.loaded = True, False
+            elif fault == "lost":
+                self.mounted = self.loaded = False
+            if not self.loaded:
+                self.tilted = False
+            if fault == "se_timeout":
+                return "Error", "SE timeout, governor not in SE"
+        elif command != "TraceSample":
+            return "Done", ""
+        return (f"Done {self.mounted}/{self.loaded}/{self.tilted}", "")
+
+
+if __name__ == "__main__":
+    parser, split_args = template_arg_parser(
+        default_prefix=SIM_PREFIX,
+        desc="Simulated EMBL sample-changer robot")
+    parser.add_argument(
+        "--production-prefix", action="store_true",
+        help=f"serve the beamline PV names, {PRODUCTION_PREFIX}")
+    args = parser.parse_args()
+    if args.production_prefix:
+        args.prefix = PRODUCTION_PREFIX
+    elif args.prefix.startswith(PRODUCTION_PREFIX.split("{")[0]):
+        parser.error(f"{args.prefix} is a beamline prefix, "
+                     "use --production-prefix to serve it")
+    ioc_options, run_options = split_args(args)
+    # caproto expands {macros} in the prefix, the beamline PVs use braces
+    ioc_options["prefix"] = (ioc_options["prefix"]
+                             .replace("{", "{{").replace("}", "}}"))
+    ioc = EMBLRobotIOC(**ioc_options)
+    run(ioc.pvdb, **run_options)
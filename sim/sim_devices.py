@@ -0,0 +1,110 @@
+"""Simulated devices for the bench_* and test_* functions of the startup
+files, to time and check device logic without an IOC.
+
+Not loaded by the profile: the functions that need them import them when
+they run (03-utils.py puts this directory on sys.path):
+
+    from sim_devices import SimCASignal, make_sim_device
+"""
+import copy
+import threading
+import time as ttime
+
+import numpy as np
+from ophyd import Component as Cpt, Device, Signal
+from ophyd.signal import EpicsSignalBase
+from ophyd.status import DeviceStatus
+
+
+class SimCASignal(Signal):
+    """In-memory stand-in for an EpicsSignal in benchmarks.
+
+    Accepts the EpicsSignal put keywords: wait=True returns after a
+    simulated CA round trip of `latency` seconds, a put callback fires after
+    the same delay. The value itself is updated (and subscribers run)
+    immediately. With `bandwidth` (bytes/s) set, get() of an array also
+    costs a round trip plus its transfer time, and honours count= like
+    EpicsSignal.get.
+    """
+
+    latency = 0.01
+    bandwidth = None
+
+    @property
+    def pvname(self):
+        return f"SIM:{self.name}"
+
+    def get(self, *, count=None, **kwargs):
+        value = super().get(**kwargs)
+        if count is not None:
+            value = value[:count]
+        if self.bandwidth is not None and isinstance(value, np.ndarray):
+            ttime.sleep(self.latency + value.nbytes / self.bandwidth)
+        return value
+
+    def put(self, value, *, wait=False, callback=None, use_complete=None,
+            timeout=None, **kwargs):
+        if wait:
+            ttime.sleep(self.latency)
+        super().put(value, **kwargs)
+        if callback is not None:
+            threading.Timer(self.latency, callback).start()
+
+
+def make_sim_device(cls):
+    """Subclass of Device `cls` with every EPICS signal replaced by a
+    SimCASignal, like ophyd.sim.make_fake_device but with put latency and
+    put callbacks, for timing device logic without an IOC."""
+    components = {}
+    for attr in cls.component_names:
+        cpt = getattr(cls, attr)
+        if issubclass(cpt.cls, Device):
+            sim_cpt = copy.copy(cpt)
+            sim_cpt.cls = make_sim_device(cpt.cls)
+        elif issubclass(cpt.cls, EpicsSignalBase):
+            sim_cpt = Cpt(SimCASignal, value=0, kind=cpt.kind)
+        else:
+            continue
+        components[attr] = sim_cpt
+    return type(f"Sim{cls.__name__}", (cls,), components)
+
+
+class SimGovernor(Device):
+    """Stand-in for a governor (mxtools.governor) in benchmarks: set(target)
+    holds state at "M" for `transition_time` seconds, then at target.
+
+    With `transitions`, {state: {target: seconds}}, only the listed targets
+    are reachable (published in `reachable`) and each transition takes its
+    own time; set() to an unreachable target fails."""
+
+    state = Cpt(Signal, value="SA")
+    reachable = Cpt(Signal, value=[])
+
+    transition_time = 0.2
+    transitions = None
+
+    def _arrived(self, value):
+        if self.transitions is not None:
+            self.reachable.put(list(self.transitions.get(value, {})))
+        self.state.put(value)
+
+    def set(self, value, **kwargs):
+        status = DeviceStatus(self)
+        duration = self.transition_time
+        if self.transitions is not None:
+            targets = self.transitions.get(self.state.get(), {})
+            if value not in targets:
+                status.set_exception(
+                    ValueError(f"{value} not reachable from "
+                               f"{self.state.get()}"))
+                return status
+            duration = targets[value]
+            self.reachable.put([])
+        self.state.put("M")
+
+        def arrive():
+            self._arrived(value)
+            status.set_finished()
+
+        threading.Timer(duration, arrive).start()
+        return status
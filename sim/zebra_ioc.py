@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""Simulated Zebra for running the fly-scan plans without hardware.
+
+Serves the PVs used by startup/25-zebra.py (and ZebraMXOr in
+96-top_alignment.py) with caproto. Position capture is modelled against
+simulated encoders that start moving when the Zebra is armed:
+
+    encoder k position = POS<k>_SET + SIM:ENC<k>_VELO * t
+
+Gates open/close where the master encoder (PC_ENC) crosses
+GATE_START + n * GATE_STEP (and + GATE_WID) in the PC_DIR direction.
+Within each gate, pulses (PC_PULSE_START/STEP/WID/DLY, in PC_TSPRE
+units) capture TIME and ENC1-4, up to PC_PULSE_MAX per gate. Every
+SIM:DL_PERIOD seconds the captured points are "downloaded": NUM_CAP,
+NUM_DOWN and the arrays grow. After the last gate closes (or on
+PC_DISARM) the last points are downloaded, PC_ARM_OUT drops and
+ARRAY_ACQ goes to 0, like the real Zebra.
+
+Only soft arming (PC_ARM) is modelled. Routing, outputs and logic gates
+are plain PVs that keep their value.
+
+    python sim/zebra_ioc.py --prefix 'XF:17IDB-ES:AMX{Zeb:2}:' --list-pvs
+"""
+import asyncio
+import time
+
+import numpy as np
+from caproto import ChannelType
+from caproto.server import PVGroup, ioc_arg_parser, pvproperty, run
+
+MAX_POINTS = 100000
+
+TIME_UNITS = ["ms", "s", "10s"]
+TIME_SCALE = {"ms": 1e-3, "s": 1.0, "10s": 10.0}
+
+
+def capture_times(p0, velocity, direction, gate_start, gate_width,
+                  gate_step, num_gates, pulse_start, pulse_width,
+                  pulse_step, pulse_delay, max_pulses, time_scale=1e-3):
+    """Capture times (s after arming) and the time the last gate closes.
+
+    p0 and velocity are the master encoder position at arming and its
+    velocity; gate parameters are in encoder units, pulse parameters in
+    `time_scale` seconds. Gates behind the starting position are never
+    crossed and produce no captures.
+    """
+    sign = 1 if direction == 0 else -1
+    n = np.arange(int(num_gates))
+    opens = gate_start + sign * n * gate_step
+    closes = opens + sign * gate_width
+    if velocity * sign <= 0 or not len(n):
+        return np.empty(0), np.inf
+    t_open = (opens - p0) / velocity
+    t_close = (closes - p0) / velocity
+    crossed = t_open >= 0
+    t_open, t_close = t_open[crossed], t_close[crossed]
+    if not len(t_open):
+        return np.empty(0), np.inf
+
+    gate_time = (t_close - t_open).max()
+    step = max(pulse_step * time_scale, 1e-9)
+    if max_pulses > 0:
+        n_pulses = int(max_pulses)
+    else:
+        n_pulses = int(gate_time // step) + 1
+    edges = (t_open[:, None] + pulse_start * time_scale
+             + step * np.arange(n_pulses)[None, :])
+    captured = edges < t_close[:, None]
+    times = (edges + pulse_delay * time_scale)[captured]
+    return times, t_close[-1]
+
+
+def _plain(body, attr, suffix, value=0, **kwargs):
+    body[attr] = pvproperty(name=suffix, value=value, **kwargs)
+
+
+def _with_rbv(body, attr, suffix, value=0, **kwargs):
+    """Setpoint 'suffix' mirrored to 'suffix:RBV'."""
+    async def put(group, instance, value):
+        await getattr(group, attr + "_rbv").write(value)
+        return value
+
+    body[attr] = pvproperty(name=suffix, value=value, put=put, **kwargs)
+    body[attr + "_rbv"] = pvproperty(name=suffix + ":RBV", value=value,
+                                     read_only=True, **kwargs)
+
+
+def _input(body, attr, suffix):
+    """Zebra input/output multiplexer: address, status, string, sync,
+    set."""
+    _with_rbv(body, attr, suffix)
+    _plain(body, attr + "_sta", suffix + ":STA", read_only=True)
+    _plain(body, attr + "_str", suffix + ":STR", value="DISCONNECT",
+           dtype=ChannelType.STRING, read_only=True)
+    _plain(body, attr + "_sync", suffix + ":SYNC")
+    _plain(body, attr + "_set", suffix + ":SET")
+
+
+def _enum(body, attr, suffix, strings, value=None):
+    _with_rbv(body, attr, suffix, value=value or strings[0],
+              enum_strings=strings, dtype=ChannelType.ENUM)
+
+
+def _array(body, attr, suffix):
+    _plain(body, attr, suffix, value=[], dtype=float,
+           max_length=MAX_POINTS, read_only=True)
+
+
+def _routing_pvs(body):
+    for i in range(4):
+        _plain(body, f"soft_in{i + 1}", f"SOFT_IN:B{i}")
+    for n in range(1, 5):
+        p = f"PULSE{n}_"
+        _with_rbv(body, f"pulse{n}_wid", p + "WID", 0.0)
+        _input(body, f"pulse{n}_inp", p + "INP")
+        _with_rbv(body, f"pulse{n}_dly", p + "DLY", 0.0)
+        _plain(body, f"pulse{n}_dly_sync", p + "DLY:SYNC")
+        _enum(body, f"pulse{n}_pre", p + "PRE", TIME_UNITS)
+        _plain(body, f"pulse{n}_out", p + "OUT", read_only=True)
+        _input(body, f"gate{n}_inp1", f"GATE{n}_INP1")
+        _input(body, f"gate{n}_inp2", f"GATE{n}_INP2")
+        _plain(body, f"gate{n}_out", f"GATE{n}_OUT", read_only=True)
+        for i in range(1, 5):
+            _plain(body, f"or{n}_ena{i}", f"OR{n}_ENA:B{i - 1}")
+            _with_rbv(body, f"or{n}_inp{i}", f"OR{n}_INP{i}")
+    for edge in ["BC", "BD", "BE", "BF"] + [f"B{i}" for i in range(8)]:
+        _plain(body, f"polarity_{edge.lower()}", f"POLARITY:{edge}")
+
+    outputs = {1: ("TTL", "LVDS", "NIM"), 2: ("TTL", "LVDS", "NIM"),
+               3: ("TTL", "LVDS", "OC"), 4: ("TTL", "NIM", "PECL")}
+    outputs.update({n: ("ENCA", "ENCB", "ENCZ", "CONN") for n in range(5, 9)})
+    for n, types in outputs.items():
+        for kind in types:
+            _input(body, f"out{n}_{kind.lower()}", f"OUT{n}_{kind}")
+
+
+def _copy_position(k):
+    """SETPOS.PROC: load the motor readback into the encoder position."""
+    async def put(group, instance, value):
+        await getattr(group, f"pos{k}_set").write(
+            getattr(group, f"m{k}_rbv").value)
+        return 0
+    return put
+
+
+def _position_capture_pvs(body):
+    for k in range(1, 5):
+        _plain(body, f"m{k}_rbv", f"M{k}:RBV", 0.0, read_only=True)
+        _plain(body, f"pos{k}_set", f"POS{k}_SET", 0.0)
+        _plain(body, f"m{k}_mres", f"M{k}:MRES", 1.0)
+        _plain(body, f"m{k}_off", f"M{k}:OFF", 0.0)
+        _plain(body, f"m{k}_setpos", f"M{k}:SETPOS.PROC",
+               put=_copy_position(k))
+        _plain(body, f"sim_enc{k}_velo", f"SIM:ENC{k}_VELO", 0.0,
+               doc="simulated encoder velocity while armed, units/s")
+
+    _enum(body, "pc_enc", "PC_ENC",
+          ["Enc1", "Enc2", "Enc3", "Enc4", "Enc1-4Av"])
+    _enum(body, "pc_dir", "PC_DIR", ["Positive", "Negative"])
+    _enum(body, "pc_tspre", "PC_TSPRE", TIME_UNITS)
+    for block, strings in (("ARM", ["Soft", "External"]),
+                           ("GATE", ["Position", "Time", "External"]),
+                           ("PULSE", ["Position", "Time", "External"])):
+        attr = f"pc_{block.lower()}"
+        _enum(body, attr + "_sel", f"PC_{block}_SEL", strings)
+        _input(body, attr + "_inp", f"PC_{block}_INP")
+        _plain(body, attr + "_out", f"PC_{block}_OUT", read_only=True)
+    for attr, suffix in (("pc_gate_ngate", "GATE_NGATE"),
+                         ("pc_gate_start", "GATE_START"),
+                         ("pc_gate_wid", "GATE_WID"),
+                         ("pc_gate_step", "GATE_STEP"),
+                         ("pc_pulse_max", "PULSE_MAX"),
+                         ("pc_pulse_start", "PULSE_START"),
+                         ("pc_pulse_wid", "PULSE_WID"),
+                         ("pc_pulse_step", "PULSE_STEP"),
+                         ("pc_pulse_dly", "PULSE_DLY")):
+        _plain(body, attr, "PC_" + suffix, 0.0)
+    for i in range(10):
+        _plain(body, f"pc_bit_cap{i}", f"PC_BIT_CAP:B{i}")
+
+    _plain(body, "pc_num_cap", "PC_NUM_CAP", read_only=True)
+    _plain(body, "pc_num_down", "PC_NUM_DOWN", read_only=True)
+    for name in ["TIME"] + [f"ENC{k}" for k in range(1, 5)] + \
+            ["SYS1", "SYS2"] + [f"DIV{k}" for k in range(1, 5)]:
+        _array(body, f"pc_{name.lower()}", f"PC_{name}")
+    _plain(body, "array_acq", "ARRAY_ACQ", read_only=True)
+    _plain(body, "sim_dl_period", "SIM:DL_PERIOD", 0.1,
+           doc="seconds between simulated downloads")
+
+
+def _make_body():
+    body = {}
+    _routing_pvs(body)
+    _position_capture_pvs(body)
+    return body
+
+
+class ZebraIOC(type(PVGroup)("_ZebraPVs", (PVGroup,), _make_body())):
+    """Zebra position capture against simulated encoders."""
+
+    pc_arm = pvproperty(name="PC_ARM", value=0)
+    pc_disarm = pvproperty(name="PC_DISARM", value=0)
+    sys_reset = pvproperty(name="SYS_RESET.PROC", value=0)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._acquisition = None
+
+    @pc_arm.putter
+    async def pc_arm(self, instance, value):
+        if value and self._acquisition is None:
+            self._acquisition = asyncio.ensure_future(self._acquire())
+        return 0
+
+    @pc_disarm.putter
+    async def pc_disarm(self, instance, value):
+        if value and self._acquisition is not None:
+            self._acquisition.cancel()
+        return 0
+
+    @sys_reset.putter
+    async def sys_reset(self, instance, value):
+        if self._acquisition is not None:
+            self._acquisition.cancel()
+        await self.pc_num_cap.write(0)
+        await self.pc_num_down.write(0)
+        return 0
+
+    async def _download(self, times, n, p0, velocities, scale):
+        await self.pc_num_cap.write(n)
+        await self.pc_time.write(times[:n] / scale)
+        for k in range(1, 5):
+            if getattr(self, f"pc_bit_cap{k - 1}").value:
+                await getattr(self, f"pc_enc{k}").write(
+                    p0[k] + velocities[k] * times[:n])
+        await self.pc_num_down.write(n)
+
+    async def _acquire(self):
+        master = self.pc_enc.value
+        master = 1 if master == "Enc1-4Av" else int(master[-1])
+        scale = TIME_SCALE[self.pc_tspre.value]
+        p0 = {k: getattr(self, f"pos{k}_set").value for k in range(1, 5)}
+        velocities = {k: getattr(self, f"sim_enc{k}_velo").value
+                      for k in range(1, 5)}
+        times, t_end = capture_times(
+            p0[master], velocities[master],
+            0 if self.pc_dir.value == "Positive" else 1,
+            self.pc_gate_start.value, self.pc_gate_wid.value,
+            self.pc_gate_step.value, self.pc_gate_ngate.value,
+            self.pc_pulse_start.value, self.pc_pulse_wid.value,
+            self.pc_pulse_step.value, self.pc_pulse_dly.value,
+            self.pc_pulse_max.value, scale)
+        times = times[:MAX_POINTS]
+
+        for name in ["time"] + [f"enc{k}" for k in range(1, 5)]:
+            await getattr(self, f"pc_{name}").write([])
+        await self.pc_num_cap.write(0)
+        await self.pc_num_down.write(0)
+        await self.array_acq.write(1)
+        await self.pc_arm_out.write(1)
+        t0 = time.monotonic()
+        n = 0
+        try:
+            while True:
+                await asyncio.sleep(self.sim_dl_period.value)
+                now = time.monotonic() - t0
+                for k in range(1, 5):
+                    await getattr(self, f"m{k}_rbv").write(
+                        p0[k] + velocities[k] * now)
+                n = int(np.searchsorted(times, now, side="right"))
+                await self._download(times, n, p0, velocities, scale)
+                if now >= t_end:
+                    break
+        except asyncio.CancelledError:
+            pass
+        finally:
+            now = time.monotonic() - t0
+            n = int(np.searchsorted(times, now, side="right"))
+            await self.pc_arm_out.write(0)
+            await self._download(times, n, p0, velocities, scale)
+            await self.array_acq.write(0)
+            self._acquisition = None
+
+
+if __name__ == "__main__":
+    ioc_options, run_options = ioc_arg_parser(
+        default_prefix="XF:17IDB-ES:AMX{Zeb:2}:",
+        desc="Simulated Zebra position capture")
+    # caproto expands {macros} in the prefix, the beamline PVs use braces
+    ioc_options["prefix"] = (ioc_options["prefix"]
+                             .replace("{", "{{").replace("}", "}}"))
+    ioc = ZebraIOC(**ioc_options)
+    run(ioc.pvdb, **run_options)
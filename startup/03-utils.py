@@ -0,0 +1,27 @@
+print(f"Loading {__file__}")
+
+import sys
+from ophyd.status import Status
+
+# Helpers shared by several device files. Nothing here connects to a PV.
+# put_concurrently is used by the PowerBrick and Zebra setup code.
+# The simulated devices the bench_* and test_* functions use are in
+# sim/sim_devices.py, imported only by those functions; sim/ goes on the
+# path here so that they can.
+_sim_dir = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sim")
+if _sim_dir not in sys.path:
+    sys.path.append(_sim_dir)
+
+
+def put_concurrently(pairs, timeout=10):
+    """Issue CA puts (with completion callbacks) for all (signal, value)
+    pairs at once and wait until every one has completed."""
+    statuses = []
+    for sig, value in pairs:
+        st = Status(sig, timeout=timeout)
+        sig.put(value, use_complete=True,
+                callback=lambda st=st, **kwargs: st.set_finished())
+        statuses.append(st)
+    for st in statuses:
+        st.wait()
@@ -0,0 +1,271 @@
+print(f"Loading {__file__}")
+
+import threading
+from collections import deque
+
+import logging
+logger = logging.getLogger(__name__)
+
+# NDArray DataType_RBV -> numpy dtype
+nd_data_types = {
+    "Int8": np.int8, "UInt8": np.uint8,
+    "Int16": np.int16, "UInt16": np.uint16,
+    "Int32": np.int32, "UInt32": np.uint32,
+    "Int64": np.int64, "UInt64": np.uint64,
+    "Float32": np.float32, "Float64": np.float64,
+}
+
+
+class FrameRingBuffer:
+    """Preallocated ring of camera frames with UniqueId and timestamp tags.
+
+    push() copies a frame into the next slot in place, nothing is allocated
+    per frame. Frames are handed out as read-only views into the ring; a
+    view stays valid until `capacity` newer frames have been pushed, use
+    copy=True (or np.array(view)) to keep a frame longer.
+    """
+
+    def __init__(self, shape, dtype=np.uint8, capacity=32):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        self._frames = np.zeros((capacity,) + self.shape, dtype=self.dtype)
+        self._flat = self._frames.reshape(capacity, -1)
+        self._uid = np.full(capacity, -1, dtype=np.int64)
+        self._timestamp = np.zeros(capacity, dtype=np.float64)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def count(self):
+        """Total number of frames pushed since creation/clear."""
+        return self._count
+
+    def clear(self):
+        with self._lock:
+            self._count = 0
+            self._uid[:] = -1
+
+    def push(self, data, uid, timestamp):
+        """Copy one frame (any shape with the right number of pixels, e.g.
+        the flat ArrayData waveform) into the ring; returns its sequence
+        number (count before the push)."""
+        npix = self._flat.shape[1]
+        with self._lock:
+            index = self._count
+            slot = index % self.capacity
+            np.copyto(self._flat[slot], data[:npix], casting="unsafe")
+            self._uid[slot] = uid
+            self._timestamp[slot] = timestamp
+            self._count += 1
+        return index
+
+    def tag(self, index, uid):
+        """Set the UniqueId of frame number `index` if it is still in the
+        ring."""
+        with self._lock:
+            if self._count - index <= self.capacity:
+                self._uid[index % self.capacity] = uid
+
+    def _view(self, slot, copy):
+        frame = self._frames[slot]
+        if copy:
+            return frame.copy()
+        frame = frame.view()
+        frame.flags.writeable = False
+        return frame
+
+    def latest(self, copy=False):
+        """Return (frame, uid, timestamp) of the newest frame."""
+        with self._lock:
+            if not self._count:
+                raise IndexError("no frames in buffer")
+            slot = (self._count - 1) % self.capacity
+            return (self._view(slot, copy), int(self._uid[slot]),
+                    float(self._timestamp[slot]))
+
+    def frame(self, uid, copy=False):
+        """Return (frame, timestamp) for a given UniqueId still in the ring."""
+        with self._lock:
+            match = np.flatnonzero(self._uid == uid)
+            if not len(match):
+                raise KeyError(f"frame {uid} is not in the buffer")
+            slot = match[0]
+            return self._view(slot, copy), float(self._timestamp[slot])
+
+    def frames(self, n=None):
+        """Copies of the last n frames, oldest first, with their UniqueIds
+        and timestamps."""
+        with self._lock:
+            n = len(self) if n is None else min(n, len(self))
+            slots = (np.arange(self._count - n, self._count)
+                     % self.capacity)
+            return (self._frames[slots], self._uid[slots].copy(),
+                    self._timestamp[slots].copy())
+
+
+class FrameGrabber:
+    """Python-side consumer of an ImagePlugin's ArrayData.
+
+    Subscribes to the plugin's ArrayData and UniqueId_RBV monitors and copies
+    every frame into a FrameRingBuffer sized from the plugin's array size and
+    data type at start(). Frames are tagged with the ArrayData CA timestamp
+    and with the UniqueId update paired with them: the two monitors arrive
+    separately (the IOC posts ArrayData before UniqueId_RBV), so each one
+    waits for its partner, and a partner that never comes is dropped rather
+    than shifting later pairs. Until its UniqueId arrives the newest frame
+    has uid -1. Gaps in UniqueId are counted as dropped frames.
+
+    The image plugin must have callbacks enabled, and the CA client must be
+    allowed large arrays (EPICS_CA_MAX_ARRAY_BYTES).
+    """
+
+    def __init__(self, plugin, capacity=32):
+        self.plugin = plugin
+        self.capacity = capacity
+        self.buffer = None
+        self.dropped = 0
+        self._last_uid = None
+        # one unpaired update of each kind at most, see the class docstring
+        self._uids = deque(maxlen=1)
+        self._untagged = deque(maxlen=1)
+        self._pair_lock = threading.Lock()
+        self._subs = []
+        self._t_start = None
+        self._new_frame = threading.Condition()
+
+    @property
+    def running(self):
+        return bool(self._subs)
+
+    def _count_dropped(self, uid):
+        if self._last_uid is not None:
+            self.dropped += max(0, uid - self._last_uid - 1)
+        self._last_uid = uid
+
+    def _uid_cb(self, value, **kwargs):
+        uid = int(value)
+        with self._pair_lock:
+            if self._untagged:
+                self.buffer.tag(self._untagged.popleft(), uid)
+                self._count_dropped(uid)
+            else:
+                self._uids.append(uid)
+
+    def _frame_cb(self, value, timestamp, **kwargs):
+        with self._pair_lock:
+            uid = self._uids.popleft() if self._uids else None
+            index = self.buffer.push(value, -1 if uid is None else uid,
+                                     timestamp)
+            if uid is None:
+                self._untagged.append(index)
+            else:
+                self._count_dropped(uid)
+        with self._new_frame:
+            self._new_frame.notify_all()
+
+    def frame_shape(self):
+        """C-order frame shape, as ImagePlugin.image reshapes ArrayData:
+        (ArraySize2, ArraySize1, ArraySize0), i.e. (depth, height, width)
+        in the array_size names, e.g. (rows, columns, 3) for RGB1."""
+        depth, height, width = self.plugin.array_size.get()
+        if self.plugin.ndimensions.get() == 3 and depth:
+            return (depth, height, width)
+        return (height, width)
+
+    def start(self):
+        if self.running:
+            return
+        shape = self.frame_shape()
+        if not all(shape):
+            raise RuntimeError(
+                f"{self.plugin.name}: invalid array size {shape}, "
+                "ensure array callbacks are on")
+        dtype = nd_data_types[self.plugin.data_type.get()]
+        if (self.buffer is None or self.buffer.shape != shape
+                or self.buffer.dtype != dtype):
+            self.buffer = FrameRingBuffer(shape, dtype, self.capacity)
+        self.buffer.clear()
+        self.dropped = 0
+        self._last_uid = None
+        self._uids.clear()
+        self._untagged.clear()
+        self._t_start = ttime.time()
+        uid_sig, data_sig = self.plugin.unique_id, self.plugin.array_data
+        self._subs = [
+            (uid_sig, uid_sig.subscribe(self._uid_cb, run=False)),
+            (data_sig, data_sig.subscribe(self._frame_cb, run=False)),
+        ]
+        logger.info(f"{self.plugin.name}: grabbing {shape} {dtype.__name__} "
+                    f"frames into a {self.capacity}-frame ring")
+
+    def stop(self):
+        for sig, cid in self._subs:
+            sig.unsubscribe(cid)
+        self._subs = []
+
+    def wait_for_frame(self, timeout=5.0, after=None):
+        """Block until a frame newer than `after` (a count, default the
+        current one) arrives, return the latest (frame, uid, timestamp)."""
+        after = self.buffer.count if after is None else after
+        with self._new_frame:
+            if not self._new_frame.wait_for(
+                    lambda: self.buffer.count > after, timeout):
+                raise TimeoutError(f"{self.plugin.name}: no new frame")
+        return self.buffer.latest()
+
+    def latest(self, copy=False):
+        return self.buffer.latest(copy=copy)
+
+    @property
+    def frame_rate(self):
+        """Average frame rate received since start()."""
+        if self._t_start is None or self.buffer is None:
+            return 0.0
+        return self.buffer.count / max(ttime.time() - self._t_start, 1e-9)
+
+
+frame_grabbers = {cam.name: FrameGrabber(cam.image)
+                  for cam in all_standard_pros}
+
+
+def bench_frame_grabber(sizes=((512, 640), (2048, 2048)), n_frames=2000,
+                        capacity=32, dtype=np.uint8):
+    """Sustained frame rate the grabber callback keeps up with.
+
+    Feeds flat waveforms, as delivered by the ArrayData monitor, followed by
+    their UniqueId straight into the FrameGrabber callbacks and compares with the naive per-frame
+    np.array(...).reshape() copy. The CA transfer itself is not included.
+    """
+    rng = np.random.default_rng(0)
+    results = {}
+    for height, width in sizes:
+        grabber = FrameGrabber(None, capacity=capacity)
+        grabber.buffer = FrameRingBuffer((height, width), dtype, capacity)
+
+        waveforms = [rng.integers(0, 255, height * width, dtype=dtype)
+                     for _ in range(4)]
+        t0 = ttime.perf_counter()
+        for k in range(n_frames):
+            grabber._frame_cb(waveforms[k % 4], timestamp=k)
+            grabber._uid_cb(k)
+        ring_rate = n_frames / (ttime.perf_counter() - t0)
+
+        frames = []
+        t0 = ttime.perf_counter()
+        for k in range(n_frames):
+            frames.append(np.array(waveforms[k % 4]).reshape(height, width))
+            if len(frames) > capacity:
+                frames.pop(0)
+        naive_rate = n_frames / (ttime.perf_counter() - t0)
+
+        key = f"{width}x{height}"
+        results[key] = {"ring_fps": ring_rate, "naive_fps": naive_rate,
+                        "dropped": grabber.dropped}
+        print(f"{key}: ring buffer {ring_rate:.0f} frames/s "
+              f"({ring_rate * height * width / 1e6:.0f} MB/s), "
+              f"naive copy {naive_rate:.0f} frames/s")
+    return results
@@ -1,12 +1,450 @@
 print(f"Loading {__file__}")
 
+import json
+from collections import deque
+from datetime import datetime
+
+import h5py
 from ophyd.mca import (EpicsMCA, EpicsDXP, Mercury1, SoftDXPTrigger)
+from ophyd.areadetector.filestore_mixins import resource_factory
+from bluesky.callbacks import CallbackBase
+
+import logging
+logger = logging.getLogger(__name__)
+
 
 class AMXMercury(Mercury1, SoftDXPTrigger):
     @property
     def hints(self):
         return {'fields': [self.mca.rois.roi0.count.name]}
 
-mercury = AMXMercury('XF:17IDB-ES:AMX{Det:Mer}', name='mercury')
+
+class MCASpectrumWriter:
+    """Append MCA spectra, one row per point, to a chunked HDF5 dataset
+
+    Rows are stored as uint16 by default, half the size of the IOC's int32;
+    counts above the dtype's range are saturated and logged. Rows are
+    buffered and written a whole chunk (chunk_rows rows) at a time, in SWMR
+    mode, so each chunk is compressed once and a reader
+    (AMXMCAHDF5Handler) sees every complete chunk while the file is still
+    being written; the last, partial chunk is written by close(). Writing
+    and flushing partial chunks instead would re-encode and reallocate the
+    chunk for every row it receives.
+    """
+
+    def __init__(self, filename, dtype='uint16', compression='gzip',
+                 chunk_rows=64):
+        self.filename = filename
+        self.dtype = np.dtype(dtype)
+        self.compression = compression
+        self.chunk_rows = chunk_rows
+        self._file = None
+        self._dataset = None
+        self._buffer = None
+        self._buffered = 0
+        self._count = 0
+        self._saturated = 0
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        # SWMR needs the dataset created before swmr_mode is switched on,
+        # which happens on the first row when its size is known
+        self._file = h5py.File(self.filename, 'w', libver='latest')
+
+    def write(self, spectrum):
+        spectrum = np.asarray(spectrum)
+        if self._dataset is None:
+            self._dataset = self._file.create_dataset(
+                'spectrum', shape=(0, spectrum.size),
+                maxshape=(None, spectrum.size),
+                chunks=(self.chunk_rows, spectrum.size),
+                dtype=self.dtype, compression=self.compression)
+            self._buffer = np.empty((self.chunk_rows, spectrum.size),
+                                    dtype=self.dtype)
+            self._file.swmr_mode = True
+        info = np.iinfo(self.dtype)
+        if spectrum.max(initial=0) > info.max:
+            if not self._saturated:
+                logger.warning(f"MCA counts exceed {self.dtype}, "
+                               f"saturating in {self.filename}")
+            self._saturated += 1
+        np.clip(spectrum, info.min, info.max, out=self._buffer[self._buffered],
+                casting='unsafe')
+        self._buffered += 1
+        index = self._count
+        self._count += 1
+        if self._buffered == self.chunk_rows:
+            self._write_buffer()
+        return index
+
+    def _write_buffer(self):
+        if not self._buffered:
+            return
+        start = self._dataset.shape[0]
+        self._dataset.resize(start + self._buffered, axis=0)
+        self._dataset[start:] = self._buffer[:self._buffered]
+        self._dataset.flush()
+        self._buffered = 0
+
+    def close(self):
+        if self._file is not None:
+            if self._dataset is not None:
+                self._write_buffer()
+            self._file.close()
+            if self._saturated:
+                logger.warning(f"{self._saturated} of {self._count} spectra "
+                               f"saturated in {self.filename}")
+        self._file = None
+        self._dataset = None
+        self._buffer = None
+
+
+class AMXMCAHDF5Handler:
+    """databroker handler for spectra written by MCASpectrumWriter
+
+    Opens the file as a SWMR reader, so rows can be read while the run is
+    still writing it."""
+    specs = {'AMX_MCA_HDF5'}
+
+    def __init__(self, filename, key='spectrum'):
+        self._file = h5py.File(filename, 'r', libver='latest', swmr=True)
+        self._key = key
+
+    def __call__(self, point_number):
+        dataset = self._file[self._key]
+        if point_number >= dataset.shape[0]:
+            dataset.refresh()
+        return dataset[point_number]
+
+    def close(self):
+        self._file.close()
+
+
+class AMXMercuryFileStore(AMXMercury):
+    """AMXMercury writing mca.spectrum to an external HDF5 file
+
+    The spectrum keeps its data key, but the event only carries a datum id
+    referencing a row of a chunked (optionally compressed) dataset with a
+    narrowed dtype, see MCASpectrumWriter. Use `db[uid].table(fill=True)`
+    or `mercury_roi_table` to get them back.
+
+    Opt-in: spectra stay inline in the events until write_path_template
+    (a strftime template of the directory) is set.
+    """
+    filestore_spec = 'AMX_MCA_HDF5'
+
+    def __init__(self, *args, write_path_template=None,
+                 spectrum_dtype='uint16', compression='gzip', chunk_rows=64,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.write_path_template = write_path_template
+        self.spectrum_dtype = spectrum_dtype
+        self.compression = compression
+        self.chunk_rows = chunk_rows
+        self._writer = None
+        self._datum_factory = None
+        self._asset_docs_cache = deque()
+
+    def stage(self):
+        if self.write_path_template is None:
+            return super().stage()
+        path = datetime.now().strftime(self.write_path_template)
+        filename = os.path.join(path, f'{uuid.uuid4()}.h5')
+        self._writer = MCASpectrumWriter(
+            filename, dtype=self.spectrum_dtype,
+            compression=self.compression, chunk_rows=self.chunk_rows)
+        self._writer.open()
+        resource, self._datum_factory = resource_factory(
+            spec=self.filestore_spec,
+            root='/',
+            resource_path=os.path.relpath(filename, '/'),
+            resource_kwargs={'key': 'spectrum'},
+            path_semantics='posix',
+        )
+        self._asset_docs_cache.append(('resource', resource))
+        try:
+            return super().stage()
+        except Exception:
+            self._close_writer()
+            raise
+
+    def unstage(self):
+        try:
+            return super().unstage()
+        finally:
+            self._close_writer()
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._writer = None
+        self._datum_factory = None
+
+    def describe(self):
+        res = super().describe()
+        key = self.mca.spectrum.name
+        if key in res and self._writer is not None:
+            res[key].update(external='FILESTORE:', dtype='array')
+        return res
+
+    def read(self):
+        res = super().read()
+        key = self.mca.spectrum.name
+        if key in res and self._writer is not None:
+            index = self._writer.write(res[key]['value'])
+            datum = self._datum_factory({'point_number': index})
+            self._asset_docs_cache.append(('datum', datum))
+            res[key] = {'value': datum['datum_id'],
+                        'timestamp': res[key]['timestamp']}
+        return res
+
+    def collect_asset_docs(self):
+        items = list(self._asset_docs_cache)
+        self._asset_docs_cache.clear()
+        yield from items
+
+
+def mca_roi_sums(spectra, rois):
+    """Sum arbitrary ROIs of one or many spectra at once.
+
+    One cumulative sum over the channel axis, then a single lookup of all
+    ROI bounds, so recomputing ROIs costs the same for 4 or 400 of them.
+
+    Parameters
+    ----------
+    spectra : array_like
+        (n_channels,) or (n_points, n_channels) counts.
+    rois : sequence of (lo, hi)
+        Inclusive channel bounds, as in the MCA record LO/HI fields.
+
+    Returns
+    -------
+    sums : ndarray
+        (n_rois,) or (n_points, n_rois) ROI counts.
+    """
+    spectra = np.asarray(spectra)
+    lo, hi = np.asarray(rois, dtype=np.intp).reshape(-1, 2).T
+    cs = np.zeros(spectra.shape[:-1] + (spectra.shape[-1] + 1,),
+                  dtype=np.int64)
+    np.cumsum(spectra, axis=-1, out=cs[..., 1:])
+    return cs[..., hi + 1] - cs[..., lo]
+
+
+def mercury_rois(mca=None):
+    """(lo, hi) channel bounds of the ROIs currently set on the IOC"""
+    mca = mca or mercury.mca
+    return [(getattr(mca.rois, f'roi{k}').lo_chan.get(),
+             getattr(mca.rois, f'roi{k}').hi_chan.get()) for k in range(4)]
+
+
+def mercury_roi_table(uid, rois=None, det=None):
+    """Recompute ROI sums for a whole run from its stored spectra"""
+    det = det or mercury
+    rois = mercury_rois(det.mca) if rois is None else rois
+    table = db[uid].table(fill=True)
+    spectra = np.stack(table[det.mca.spectrum.name].to_numpy())
+    return pd.DataFrame(
+        mca_roi_sums(spectra, rois), index=table.index,
+        columns=[f'roi_{lo}_{hi}' for lo, hi in rois])
+
+
+def mercury_storage_overhead(n_points=1000, n_channels=2048, path='/tmp',
+                             spectrum_dtype='uint16', compression='gzip',
+                             chunk_rows=64):
+    """Compare event size and per-point cost of inline vs external spectra
+
+    Uses synthetic fluorescence-like spectra, nothing is read from the IOC.
+    """
+    rng = np.random.default_rng(0)
+    channels = np.arange(n_channels)
+    shape = 2000 * np.exp(-0.5 * ((channels - 1100) / 15) ** 2) + 20
+    spectra = rng.poisson(shape, size=(n_points, n_channels)).astype(np.int32)
+
+    def event(value):
+        return {'data': {'mercury_mca_spectrum': value},
+                'timestamps': {'mercury_mca_spectrum': ttime.time()}}
+
+    t0 = ttime.perf_counter()
+    inline_size = sum(len(json.dumps(event(s.tolist()))) for s in spectra)
+    inline_time = ttime.perf_counter() - t0
+
+    filename = os.path.join(path, f'{uuid.uuid4()}.h5')
+    writer = MCASpectrumWriter(filename, dtype=spectrum_dtype,
+                               compression=compression, chunk_rows=chunk_rows)
+    writer.open()
+    _, datum_factory = resource_factory(
+        spec='AMX_MCA_HDF5', root='/', resource_path=filename,
+        resource_kwargs={'key': 'spectrum'}, path_semantics='posix')
+    external_size = 0
+    t0 = ttime.perf_counter()
+    for s in spectra:
+        datum = datum_factory({'point_number': writer.write(s)})
+        external_size += (len(json.dumps(event(datum['datum_id'])))
+                          + len(json.dumps(datum)))
+    writer.close()
+    external_time = ttime.perf_counter() - t0
+    file_size = os.path.getsize(filename)
+    os.remove(filename)
+
+    result = {
+        'inline_bytes_per_point': inline_size / n_points,
+        'external_bytes_per_point': external_size / n_points,
+        'file_bytes_per_point': file_size / n_points,
+        'inline_ms_per_point': 1e3 * inline_time / n_points,
+        'external_ms_per_point': 1e3 * external_time / n_points,
+    }
+    for k, v in result.items():
+        print(f'{k:>28}: {v:.4g}')
+    return result
+
+
+def mercury_deadtime_factor(real_time, live_time, icr, ocr):
+    """Dead-time correction factor for Mercury counts, vectorised.
+
+    ICR/OCR where both rates are available, real/live time otherwise (e.g.
+    points with no counts). Accepts scalars or arrays of any shape.
+    """
+    real_time, live_time, icr, ocr = (
+        np.asarray(a, dtype=float)
+        for a in (real_time, live_time, icr, ocr))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = np.where((icr > 0) & (ocr > 0), icr / ocr,
+                          real_time / live_time)
+    return np.where(np.isfinite(factor), factor, 1.0)
+
+
+def _mercury_deadtime_keys(det):
+    return {
+        'real_time': det.mca.elapsed_real_time.name,
+        'live_time': det.mca.elapsed_live_time.name,
+        'icr': det.dxp.input_count_rate.name,
+        'ocr': det.dxp.output_count_rate.name,
+    }
+
+
+def mercury_deadtime_correct(data, det=None, fields=None):
+    """Dead-time correct ROI counts of whole columns at once.
+
+    Parameters
+    ----------
+    data : mapping or DataFrame
+        Column arrays keyed by data key, e.g. a run table.
+    fields : list of str
+        Count fields to correct, default the four ROI counts.
+
+    Returns
+    -------
+    corrected : dict
+        {field + '_dtc': array, 'dt_factor': array}
+    """
+    det = det or mercury
+    keys = _mercury_deadtime_keys(det)
+    fields = fields or [getattr(det.mca.rois, f'roi{k}').count.name
+                        for k in range(4)]
+    factor = mercury_deadtime_factor(
+        *(np.asarray(data[keys[k]])
+          for k in ('real_time', 'live_time', 'icr', 'ocr')))
+    corrected = {f'{field}_dtc': np.asarray(data[field]) * factor
+                 for field in fields if field in data}
+    corrected['dt_factor'] = factor
+    return corrected
+
+
+def mercury_deadtime_runs(uids, det=None, fields=None):
+    """Dead-time corrected ROI counts for many runs.
+
+    Each run's table is fetched once and corrected as whole arrays; the
+    result is one DataFrame with a 'uid' column.
+    """
+    det = det or mercury
+    frames = []
+    for uid in uids:
+        table = db[uid].table()
+        corrected = mercury_deadtime_correct(table, det=det, fields=fields)
+        frame = pd.DataFrame(corrected, index=table.index)
+        frame['uid'] = uid
+        frames.append(frame)
+    return pd.concat(frames)
+
+
+class MercuryDeadTimeCorrection(CallbackBase):
+    """Live callback accumulating dead-time corrected Mercury ROI counts
+
+    Works on events and, without splitting them, on event pages. The
+    corrected columns of the current run are in `self.corrected`.
+    """
+
+    def __init__(self, det=None, fields=None):
+        super().__init__()
+        self._det = det
+        self._fields = fields
+        self.corrected = {}
+
+    def start(self, doc):
+        self.corrected = {}
+
+    def _append(self, data):
+        if _mercury_deadtime_keys(self._det or mercury)['icr'] not in data:
+            return
+        for k, v in mercury_deadtime_correct(
+                data, det=self._det, fields=self._fields).items():
+            self.corrected.setdefault(k, []).append(np.atleast_1d(v))
+
+    def event(self, doc):
+        self._append(doc['data'])
+
+    def event_page(self, doc):
+        self._append(doc['data'])
+
+    def stop(self, doc):
+        self.corrected = {k: np.concatenate(v)
+                          for k, v in self.corrected.items()}
+
+
+def bench_deadtime_correction(n=10**5):
+    """Row loop vs vectorised dead-time correction on n synthetic points"""
+    rng = np.random.default_rng(0)
+    keys = _mercury_deadtime_keys(mercury)
+    roi = mercury.mca.rois.roi0.count.name
+    icr = rng.uniform(1e3, 2e5, n)
+    ocr = icr * np.exp(-icr * 1e-6)
+    df = pd.DataFrame({
+        keys['real_time']: np.full(n, 1.0),
+        keys['live_time']: 1.0 - rng.uniform(0, 0.2, n),
+        keys['icr']: icr,
+        keys['ocr']: ocr,
+        roi: rng.poisson(1000, n),
+    })
+
+    t0 = ttime.perf_counter()
+    looped = []
+    for _, row in df.iterrows():
+        if row[keys['icr']] > 0 and row[keys['ocr']] > 0:
+            f = row[keys['icr']] / row[keys['ocr']]
+        else:
+            f = row[keys['real_time']] / row[keys['live_time']]
+        looped.append(row[roi] * f)
+    loop_time = ttime.perf_counter() - t0
+
+    t0 = ttime.perf_counter()
+    vectorised = mercury_deadtime_correct(df, fields=[roi])[f'{roi}_dtc']
+    vec_time = ttime.perf_counter() - t0
+
+    assert np.allclose(looped, vectorised)
+    print(f"{n} points: row loop {loop_time:.3f} s, vectorised "
+          f"{vec_time * 1e3:.2f} ms ({loop_time / vec_time:.0f}x)")
+    return loop_time, vec_time
+
+
+# spectra go to HDF5 files only once e.g.
+# mercury.write_path_template = '/nsls2/data/amx/legacy/mercury/%Y/%m/%d'
+mercury = AMXMercuryFileStore('XF:17IDB-ES:AMX{Det:Mer}', name='mercury')
 mercury.read_attrs = ['mca.spectrum', 'mca.preset_live_time', 'mca.rois.roi0.count',
-                      'mca.rois.roi1.count', 'mca.rois.roi2.count', 'mca.rois.roi3.count']
+                      'mca.rois.roi1.count', 'mca.rois.roi2.count', 'mca.rois.roi3.count',
+                      'mca.elapsed_real_time', 'mca.elapsed_live_time',
+                      'dxp.input_count_rate', 'dxp.output_count_rate']
+
+try:
+    db.reg.register_handler('AMX_MCA_HDF5', AMXMCAHDF5Handler, overwrite=True)
+except AttributeError:
+    logger.warning('Could not register the AMX_MCA_HDF5 handler with db')
@@ -1,8 +1,69 @@
 print(f"Loading {__file__}")
 
+import threading
 from ophyd import (EpicsSignal, EpicsSignalRO, EpicsMotor, Device, Component as Cpt,
                    DeviceStatus)
 
+
+# one row per vector segment of a PowerBrickVector program
+vector_segment_dtype = np.dtype([
+    ('x_start', float), ('x_end', float),
+    ('y_start', float), ('y_end', float),
+    ('z_start', float), ('z_end', float),
+    ('o_start', float), ('o_end', float),
+    ('exposure', float), ('num_samples', np.int64),
+])
+
+
+def vector_program(segments, limits=None):
+    """Validate vector segments and return them as a structured array.
+
+    Parameters
+    ----------
+    segments : array-like
+        Structured array with vector_segment_dtype, or an (n, 10) array with
+        columns x/y/z/o start and end, exposure and num_samples, in that
+        order.
+    limits : dict, optional
+        Axis name ('x', 'y', 'z', 'o') -> (low, high); every start and end
+        must lie within.
+    """
+    segments = np.asarray(segments)
+    if segments.dtype.names is None:
+        segments = np.atleast_2d(segments)
+        if segments.shape[1] != len(vector_segment_dtype.names):
+            raise ValueError(
+                f"expected {len(vector_segment_dtype.names)} columns "
+                f"{vector_segment_dtype.names}, got {segments.shape[1]}")
+        program = np.empty(len(segments), dtype=vector_segment_dtype)
+        for k, field in enumerate(vector_segment_dtype.names):
+            program[field] = segments[:, k]
+    else:
+        program = segments.astype(vector_segment_dtype)
+
+    if not len(program):
+        raise ValueError("vector program has no segments")
+    for field in vector_segment_dtype.names:
+        bad = ~np.isfinite(program[field])
+        if bad.any():
+            raise ValueError(f"non-finite {field} in segments "
+                             f"{np.flatnonzero(bad).tolist()}")
+    bad = np.flatnonzero(program['exposure'] <= 0)
+    if len(bad):
+        raise ValueError(f"exposure must be positive, segments {bad.tolist()}")
+    bad = np.flatnonzero(program['num_samples'] < 1)
+    if len(bad):
+        raise ValueError(
+            f"num_samples must be at least 1, segments {bad.tolist()}")
+    for axis, (low, high) in (limits or {}).items():
+        for field in (f'{axis}_start', f'{axis}_end'):
+            bad = np.flatnonzero((program[field] < low)
+                                 | (program[field] > high))
+            if len(bad):
+                raise ValueError(f"{field} outside ({low}, {high}) in "
+                                 f"segments {bad.tolist()}")
+    return program
+
 class PBSignalWithRBV(EpicsSignal):
     # An EPICS signal that uses the NSLS-II convention of 'pvname-SP' being the
     # setpoint and 'pvname-I' being the read-back
@@ -51,11 +112,130 @@ class PowerBrickVectorBase(Device):
 
 
 class PowerBrickVector(PowerBrickVectorBase):
+    """Single vector (set x/y/z/o start/end, exposure, num_samples first) or,
+    after load_program(), a whole multi-segment program per kickoff.
+
+    A program is run with hold on: every segment is sent with Go, waits in
+    the hold state at its start position and is released with Proceed.
+    Once a segment holds, its setpoints have been taken by the controller,
+    so the next segment is written while the current one runs and the Go
+    for it follows the end of the current one with no setup in between.
+    """
+
+    segment_timeout = 60
+
     def __init__(self, prefix, *args, **kwargs):
         self._running_status = None
+        self._program = None
+        self._program_thread = None
+        self._kickoff_status = None
+        # hold setting to restore after a program, read at its kickoff
+        self._hold_before = 0
+        self._proceed_event = threading.Event()
+        self._holding_event = threading.Event()
+        self._done_event = threading.Event()
+        self._abort_event = threading.Event()
+        self._segment_times = []
+        self._last_collected = 0
+        self._subs = []
         super().__init__(prefix, *args, **kwargs)
 
+    def load_program(self, segments, limits=None):
+        """Validate segments (see vector_program) for the next kickoffs;
+        None goes back to single-vector mode."""
+        self._program = (None if segments is None
+                         else vector_program(segments, limits=limits))
+        return self._program
+
+    @property
+    def program(self):
+        return self._program
+
+    def _segment_pairs(self, segment):
+        pairs = []
+        for axis, motor in zip('xyzo', self.motors):
+            pairs += [(motor.start, segment[f'{axis}_start']),
+                      (motor.end, segment[f'{axis}_end'])]
+        pairs += [(self.exposure, segment['exposure']),
+                  (self.num_samples, int(segment['num_samples']))]
+        return pairs
+
+    def write_segment(self, segment):
+        put_concurrently(self._segment_pairs(segment))
+
+    def _state_cb(self, value, old_value, **kwargs):
+        if old_value != 2 and value == 2:
+            self._holding_event.set()
+
+    def _running_cb(self, value, old_value, **kwargs):
+        if old_value == 1 and value == 0:
+            self._done_event.set()
+
+    def _wait(self, event, what, timeout=None):
+        deadline = ttime.time() + (timeout or self.segment_timeout)
+        while not event.wait(0.1):
+            if self._abort_event.is_set():
+                break
+            if timeout is not False and ttime.time() > deadline:
+                raise TimeoutError(
+                    f"{self.name}: timed out waiting for {what}")
+        if self._abort_event.is_set():
+            raise RuntimeError(f"{self.name}: vector program aborted")
+
+    def _run_program(self, program, status):
+        try:
+            self.write_segment(program[0])
+            for i in range(len(program)):
+                self._holding_event.clear()
+                self._done_event.clear()
+                self.go.put(1, wait=True)
+                self._wait(self._holding_event, f"segment {i} to hold")
+                if i == 0:
+                    self._kickoff_status.set_finished()
+                    self._wait(self._proceed_event, "complete()", timeout=False)
+                t_start = ttime.time()
+                self.proceed.put(1, wait=True)
+                if i + 1 < len(program):
+                    self.write_segment(program[i + 1])
+                self._wait(self._done_event, f"segment {i} to finish")
+                self._segment_times.append((i, t_start, ttime.time()))
+        except Exception as error:
+            if not self._kickoff_status.done:
+                self._kickoff_status.set_exception(error)
+            status.set_exception(error)
+        else:
+            status.set_finished()
+        finally:
+            for sig, cid in self._subs:
+                sig.unsubscribe(cid)
+            self._subs = []
+            self.hold.put(self._hold_before)
+
+    def _kickoff_program(self):
+        program = self._program
+        self._segment_times = []
+        self._last_collected = 0
+        for event in (self._proceed_event, self._abort_event):
+            event.clear()
+        self._kickoff_status = DeviceStatus(self)
+        self._running_status = DeviceStatus(self)
+        self._hold_before = self.hold.get()
+        self.hold.put(1, wait=True)
+        self._subs = [
+            (self.state, self.state.subscribe(self._state_cb, run=False)),
+            (self.running,
+             self.running.subscribe(self._running_cb, run=False)),
+        ]
+        self._program_thread = threading.Thread(
+            target=self._run_program, args=(program, self._running_status),
+            name=f"{self.name}_program", daemon=True)
+        self._program_thread.start()
+        return self._kickoff_status
+
     def kickoff(self):
+        if self._program is not None:
+            return self._kickoff_program()
+
         self._running_status = running_status = DeviceStatus(self)
         holding_status = DeviceStatus(self)
 
@@ -80,9 +260,140 @@ class PowerBrickVector(PowerBrickVectorBase):
         return holding_status
 
     def complete(self):
+        if self._program is not None:
+            self._proceed_event.set()
+            return self._running_status
         if self.hold.get():
             self.proceed.put(1, wait=True)
         return self._running_status
 
+    def stop(self, *, success=False):
+        if self._program_thread is not None and self._program_thread.is_alive():
+            self._abort_event.set()
+            self.abort.put(1)
+
+    def describe_collect(self):
+        return {
+            'primary': {
+                f'{self.name}_{key}': {
+                    'source': f'{self.name}:program',
+                    'shape': [],
+                    'dtype': 'integer' if key in ('segment', 'num_samples')
+                    else 'number',
+                } for key in ('segment', 'duration') + vector_segment_dtype.names
+            }
+        }
+
+    def collect(self):
+        """One event per finished program segment, with its setpoints."""
+        n = len(self._segment_times)
+        for i, t_start, t_end in self._segment_times[self._last_collected:n]:
+            segment = self._program[i]
+            data = {f'{self.name}_segment': i,
+                    f'{self.name}_duration': t_end - t_start}
+            data.update({f'{self.name}_{field}': segment[field].item()
+                         for field in vector_segment_dtype.names})
+            yield {
+                'data': data,
+                'timestamps': {k: t_end for k in data},
+                'time': t_end,
+            }
+        self._last_collected = n
+
 
 pb_vector = PowerBrickVector('XF:17IDC-ES:FMX{Gon:1-Vec}', name='pb_vector')
+
+
+def sim_powerbrick_vector(prefix='SIM:PB', *args, speed=2.0, overhead=0.02,
+                          **kwargs):
+    """PowerBrickVector with a simulated controller, for benchmarks.
+
+    Go moves all axes to their start at `speed` (units/s) plus a fixed
+    `overhead` and holds there if hold is on until Proceed; the vector then
+    takes num_samples * exposure (ms). Every put costs SimCASignal.latency.
+    """
+
+    from sim_devices import make_sim_device
+
+    class SimPowerBrickVector(make_sim_device(PowerBrickVector)):
+        def __init__(self, prefix, *args, speed, overhead, **kwargs):
+            super().__init__(prefix, *args, **kwargs)
+            self.speed = speed
+            self.overhead = overhead
+            self.position = np.zeros(4)
+            self._sim_proceed = threading.Event()
+            self.go.subscribe(self._sim_go, run=False)
+            self.proceed.subscribe(
+                lambda **kwargs: self._sim_proceed.set(), run=False)
+
+        def _sim_go(self, **kwargs):
+            start = np.array([m.start.get() for m in self.motors])
+            end = np.array([m.end.get() for m in self.motors])
+            duration = self.num_samples.get() * self.exposure.get() / 1000
+            hold = self.hold.get()
+            self._sim_proceed.clear()
+
+            def run():
+                self.running.put(1)
+                ttime.sleep(self.overhead
+                            + np.abs(start - self.position).max() / self.speed)
+                self.position = start
+                if hold:
+                    self.state.put(2)
+                    self._sim_proceed.wait()
+                self.state.put(1)
+                ttime.sleep(duration)
+                self.position = end
+                self.state.put(0)
+                self.running.put(0)
+
+            threading.Thread(target=run, daemon=True).start()
+
+    return SimPowerBrickVector(prefix, *args, speed=speed, overhead=overhead,
+                               **kwargs)
+
+
+def bench_vector_program(n_segments=20, length=0.2, exposure=2.0,
+                         num_samples=50, latency=0.01, speed=2.0):
+    """Compare per-segment setup + kickoff/complete with one program.
+
+    Segments are `length`-long x lines stepped in y, each taking
+    num_samples * exposure ms, on a sim_powerbrick_vector with `latency` s per
+    put. Returns the total and per-segment dead time of both approaches.
+    """
+    from sim_devices import SimCASignal
+
+    SimCASignal.latency = latency
+    segments = np.zeros((n_segments, 10))
+    segments[:, 1] = length
+    segments[:, 2:4] = 0.01 * np.arange(n_segments)[:, None]
+    segments[:, 8] = exposure
+    segments[:, 9] = num_samples
+    program = vector_program(segments)
+    busy = n_segments * num_samples * exposure / 1000
+
+    pb = sim_powerbrick_vector(name='sim_pb', speed=speed)
+    t0 = ttime.time()
+    for segment in program:
+        for sig, value in pb._segment_pairs(segment):
+            sig.put(value, wait=True)
+        pb.kickoff().wait()
+        pb.complete().wait()
+    naive = ttime.time() - t0
+
+    pb = sim_powerbrick_vector(name='sim_pb', speed=speed)
+    pb.load_program(program)
+    t0 = ttime.time()
+    pb.kickoff().wait()
+    pb.complete().wait()
+    streamed = ttime.time() - t0
+    assert len(list(pb.collect())) == n_segments
+
+    results = {'exposure_time': busy, 'naive': naive, 'program': streamed,
+               'naive_dead_per_segment': (naive - busy) / n_segments,
+               'program_dead_per_segment': (streamed - busy) / n_segments}
+    print(f"{n_segments} segments, {busy:.2f} s exposing: per-segment setup "
+          f"{naive:.2f} s ({results['naive_dead_per_segment'] * 1e3:.0f} ms "
+          f"dead/segment), program {streamed:.2f} s "
+          f"({results['program_dead_per_segment'] * 1e3:.0f} ms dead/segment)")
+    return results
@@ -7,12 +7,51 @@ from ophyd import (Device, Component as Cpt, FormattedComponent as FC,
 from ophyd import (EpicsSignal, EpicsSignalRO, DeviceStatus)
 from ophyd.utils import set_and_wait
 from bluesky.plans import fly
+import bluesky.plan_stubs as bps
 import pandas as pd
 
+import json
+import logging
+import threading
 import uuid
 import time
 import datetime as dt
 import os
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+try:
+    # bluesky >= 1.11 emits event pages from collect_pages(); older
+    # versions (the 2022-2.3 environments) only call collect()
+    from bluesky.protocols import EventPageCollectable  # noqa: F401
+    bluesky_collect_pages = True
+except ImportError:
+    bluesky_collect_pages = False
+
+
+def events_from_pages(pages):
+    """One event per row of columnar event pages, timed by the first
+    timestamp column; collect() for bluesky without collect_pages."""
+    for page in pages:
+        data, timestamps = page['data'], page['timestamps']
+        if not data:
+            continue
+        times = next(iter(timestamps.values()))
+        for i, t in enumerate(times):
+            yield {
+                'data': {k: v[i] for k, v in data.items()},
+                'timestamps': {k: v[i] for k, v in timestamps.items()},
+                'time': t,
+            }
+
+
+def collect_paged(obj):
+    """bps.collect for an object with collect_pages: event pages where the
+    RunEngine supports them, otherwise one streamed event per row."""
+    if bluesky_collect_pages:
+        return (yield from bps.collect(obj))
+    return (yield from bps.collect(obj, stream=True))
 
 
 def _get_configuration_attrs(cls, *, signal_class=Signal):
@@ -274,6 +313,26 @@ class ZebraEncoder(Device):
     def copy_position(self):
         self._copy_pos_signal.put(1, wait=True)
 
+    def calibration(self):
+        """(MRES, OFF) of this encoder, from the Zebra's monitors when the
+        parent is a Zebra."""
+        value = getattr(self.parent, '_config_value', None)
+        if value is None:
+            return self.encoder_res.get(), self.encoder_off.get()
+        return value(self.encoder_res), value(self.encoder_off)
+
+    def positions(self, counts):
+        """Motor positions for an array of raw encoder counts. The sign of
+        MRES carries the encoder direction."""
+        mres, off = self.calibration()
+        return np.asarray(counts, dtype=float) * mres + off
+
+    def counts(self, positions):
+        """Raw encoder counts for an array of motor positions."""
+        mres, off = self.calibration()
+        return np.rint((np.asarray(positions, dtype=float) - off)
+                       / mres).astype(np.int64)
+
 
 class ZebraGateInput(Device):
     addr = Cpt(ZebraSignalWithRBV, '')
@@ -554,25 +613,194 @@ class ZebraBase(Device):
         return status
 
 
+class ZebraDownload:
+    """Position-capture data fetched while the Zebra is still acquiring.
+
+    A monitor on NUM_DOWN wakes a worker thread that reads TIME and the
+    captured ENCn waveforms up to NUM_DOWN and copies only the new elements
+    into preallocated buffers (doubled when full). CA cannot read a
+    waveform from an offset, so each read still transfers the array from
+    the start; nothing already fetched is copied again.
+
+    pages() hands out the rows not emitted yet, data() the rows fetched so
+    far, so a plan can collect and analyse while the motion is running.
+    """
+
+    def __init__(self, zebra, capacity=None):
+        self.zebra = zebra
+        pc = zebra.pos_capt
+        self._num_down = pc.data.num_downloaded
+        self._sigs = {'time': pc.data.time}
+        self._sigs.update({
+            f'enc{i}': getattr(pc.data, f'enc{i}') for i in range(1, 5)
+            if getattr(pc, f'capture_enc{i}').get()
+        })
+        if capacity is None:
+            capacity = (int(pc.gate.num_gates.get())
+                        * max(int(pc.pulse.max_pulses.get()), 1))
+        capacity = max(capacity, 1024)
+        self._buffers = {k: np.empty(capacity) for k in self._sigs}
+        self.n_fetched = 0
+        self.n_emitted = 0
+        self.fetches = 0
+        self._target = 0
+        self._finishing = False
+        self._stopped = False
+        self._final_status = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._sub = None
+
+    def start(self):
+        self._sub = self._num_down.subscribe(self._num_down_cb, run=False)
+        threading.Thread(target=self._run, daemon=True,
+                         name=f'{self.zebra.name}_download').start()
+
+    def stop(self):
+        """Stop downloading: drop the NUM_DOWN monitor and end the worker,
+        failing finish() if it is still waiting."""
+        self._stopped = True
+        self._unsubscribe()
+        self._wakeup.set()
+
+    def _unsubscribe(self):
+        if self._sub is not None:
+            self._num_down.unsubscribe(self._sub)
+            self._sub = None
+
+    def finish(self, after):
+        """Status that finishes once everything downloaded after the `after`
+        status (the disarm) has been fetched."""
+        if self._final_status is None:
+            self._final_status = DeviceStatus(self.zebra)
+
+            def finishing(status):
+                self._finishing = True
+                self._wakeup.set()
+
+            after.add_callback(finishing)
+        return self._final_status
+
+    def _num_down_cb(self, value, **kwargs):
+        self._target = max(self._target, int(value))
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if self._stopped:
+                if (self._final_status is not None
+                        and not self._final_status.done):
+                    self._final_status.set_exception(RuntimeError(
+                        f"{self.zebra.name}: download stopped"))
+                return
+            finishing = self._finishing
+            try:
+                if finishing:
+                    self._target = max(self._target,
+                                       int(self._num_down.get()))
+                if self._target > self.n_fetched:
+                    self._fetch(self._target)
+            except Exception as error:
+                if not finishing:
+                    logger.warning(f"{self.zebra.name}: download failed, "
+                                   f"retrying at the next update: {error}")
+                    continue
+                self._unsubscribe()
+                self._final_status.set_exception(error)
+                return
+            if finishing:
+                self._unsubscribe()
+                self._final_status.set_finished()
+                return
+
+    def _fetch(self, n):
+        arrays = {k: np.asarray(sig.get(count=n))
+                  for k, sig in self._sigs.items()}
+        n = min([n] + [len(v) for v in arrays.values()])
+        start = self.n_fetched
+        if n <= start:
+            return
+        self._reserve(n)
+        self._buffers['time'][start:n] = self.zebra.wall_times(
+            arrays.pop('time')[start:n])
+        for k, v in arrays.items():
+            self._buffers[k][start:n] = self.zebra.encoder_positions(
+                int(k[-1]), v[start:n])
+        with self._lock:
+            self.n_fetched = n
+            self.fetches += 1
+
+    def _reserve(self, n):
+        capacity = len(self._buffers['time'])
+        if n <= capacity:
+            return
+        capacity = max(n, 2 * capacity)
+        with self._lock:
+            buffers = {k: np.empty(capacity) for k in self._buffers}
+            for k, v in self._buffers.items():
+                buffers[k][:self.n_fetched] = v[:self.n_fetched]
+            self._buffers = buffers
+
+    def data(self):
+        """(timestamps, {encN: positions}) of the rows fetched so far, as
+        views into the buffers."""
+        with self._lock:
+            n, buffers = self.n_fetched, self._buffers
+        return buffers['time'][:n], {k: v[:n] for k, v in buffers.items()
+                                     if k != 'time'}
+
+    def pages(self, page_size):
+        with self._lock:
+            start, stop = self.n_emitted, self.n_fetched
+            buffers = self._buffers
+            self.n_emitted = stop
+        ts = buffers['time']
+        for first in range(start, stop, page_size):
+            last = min(first + page_size, stop)
+            yield {
+                'data': {k: v[first:last] for k, v in buffers.items()
+                         if k != 'time'},
+                'timestamps': {k: ts[first:last] for k in buffers
+                               if k != 'time'},
+            }
+
+
 class Zebra(ZebraBase):
 
+    # rows per event page emitted by collect_pages
+    page_size = 100000
+    # fetch data during acquisition (ZebraDownload), so that collect_pages
+    # can be called repeatedly before complete() finishes
+    incremental = False
+    # True if the IOC delivers ENCn in raw counts rather than in motor
+    # units (scaled with MRES/OFF by the IOC, the default)
+    raw_encoder_counts = False
+
+    _time_scales = {'ms': 1e-3, 's': 1.0, '10s': 10.0}
+
+    # arm/disarm timing records kept for timings_frame()/timing_stats()
+    timing_history = 500
+    # edges (in order) that every arm cycle should show
+    _timing_edges = ('armed', 'download_start', 'disarmed', 'download_done')
+
     def __init__(self, prefix, *args, **kwargs):
         self._collection_ts = None
+        self._armed_ts = None
+        self.timings = deque(maxlen=self.timing_history)
+        self._timing = None
+        self._timing_subs = []
         self._disarmed_status = None
         self._dl_status = None
+        self._download = None
+        self._config_cache = {}
+        self._config_subs = {}
         super().__init__(prefix, *args, **kwargs)
 
-    def setup(self, master, arm_source, gate_start, gate_width, gate_step, num_gates,
-              direction, pulse_width, pulse_step, capt_delay, max_pulses,
-              collect=[True, True, True, True]):
-
-        # arm_source is either 0 (soft) or 1 (external)
-        # direction is either 0 (positive) or 1 (negative)
-        # gate_* parameters in motor units
-        # pulse_*, capt_delay parameters in ms
-        # collect represents which of the four encoders to collect data from
-
-        # Sanity checks
+    @staticmethod
+    def _check_setup_args(master, arm_source, direction, gate_width,
+                          gate_step, pulse_width, pulse_step):
         if master not in range(4):
             raise ValueError(f"Invalid master positioner '{master}', must be between 0 and 3")
 
@@ -588,6 +816,115 @@ class Zebra(ZebraBase):
         if pulse_width > pulse_step:
             raise ValueError('pulse_width must be smaller than pulse_step')
 
+    def _setup_stages(self, master, arm_source, gate_start, gate_width,
+                      gate_step, num_gates, direction, pulse_width,
+                      pulse_step, capt_delay, max_pulses, collect):
+        pc = self.pos_capt
+        captures = (pc.capture_enc1, pc.capture_enc2, pc.capture_enc3,
+                    pc.capture_enc4)
+        return [
+            # Sources, units and direction first: the gate and pulse values
+            # are interpreted in them
+            [(pc.arm.source, arm_source),
+             (pc.time_units, "ms"),
+             (pc.gate.source, "Position"),
+             (pc.pulse.source, "Time"),
+             (pc.source, master),
+             (pc.direction, direction)] +
+            [(encoder, int(do_capture))
+             for encoder, do_capture in zip(captures, collect)],
+            [(pc.gate.start, gate_start),
+             (pc.gate.width, gate_width),
+             (pc.gate.step, gate_step),
+             (pc.gate.num_gates, num_gates),
+             (pc.pulse.start, 0),
+             (pc.pulse.step, pulse_step),
+             (pc.pulse.width, pulse_width),
+             (pc.pulse.delay, capt_delay),
+             (pc.pulse.max_pulses, max_pulses)],
+        ]
+
+    def _config_cb(self, value, obj, **kwargs):
+        self._config_cache[obj.name] = value
+
+    def _config_value(self, sig):
+        """Monitored value of a setup field, subscribing on first use."""
+        if sig.name not in self._config_subs:
+            self._config_subs[sig.name] = sig.subscribe(
+                self._config_cb, run=True)
+        return self._config_cache.get(sig.name)
+
+    def _differs(self, sig, value):
+        current = self._config_value(sig)
+        if current is None:
+            return True
+        if isinstance(value, str) != isinstance(current, str):
+            # compare enums by index
+            enum_strs = list(getattr(sig, 'enum_strs', None) or ())
+            try:
+                if isinstance(value, str):
+                    value = enum_strs.index(value)
+                else:
+                    current = enum_strs.index(current)
+            except ValueError:
+                return True
+        if isinstance(value, str):
+            return current != value
+        return not np.isclose(float(current), float(value),
+                              rtol=1e-9, atol=1e-12)
+
+    def setup(self, master, arm_source, gate_start, gate_width, gate_step, num_gates,
+              direction, pulse_width, pulse_step, capt_delay, max_pulses,
+              collect=[True, True, True, True], reset=False):
+        """Configure position capture, writing only what changed.
+
+        Same parameters as setup_sequential. Independent writes go out
+        concurrently: first sources/units/direction/capture bits, then gate
+        and pulse values, then all encoder position copies. The Zebra is
+        only disarmed, the current configuration is taken from monitors on
+        the setup fields and only fields that differ are written. With
+        reset=True it is reset first and every field is written, as
+        setup_sequential does.
+        """
+        self._check_setup_args(master, arm_source, direction, gate_width,
+                               gate_step, pulse_width, pulse_step)
+
+        if reset:
+            self.reset.put(1, wait=True)
+            time.sleep(0.1)
+        elif int(self.pos_capt.arm.output.get()):
+            self.pos_capt.arm.disarm.put(1, wait=True)
+
+        written = []
+        for stage in self._setup_stages(
+                master, arm_source, gate_start, gate_width, gate_step,
+                num_gates, direction, pulse_width, pulse_step, capt_delay,
+                max_pulses, collect):
+            changes = [(sig, value) for sig, value in stage
+                       if reset or self._differs(sig, value)]
+            put_concurrently(changes)
+            written += [sig.name for sig, _ in changes]
+
+        # Synchronize encoders (do it last)
+        put_concurrently(
+            [(encoder._copy_pos_signal, 1)
+             for encoder in self.encoder.values()])
+        return written
+
+    def setup_sequential(self, master, arm_source, gate_start, gate_width, gate_step, num_gates,
+              direction, pulse_width, pulse_step, capt_delay, max_pulses,
+              collect=[True, True, True, True]):
+        """Former setup: reset, then every field written in sequence.
+        Kept for comparison with setup() and as a fallback."""
+        # arm_source is either 0 (soft) or 1 (external)
+        # direction is either 0 (positive) or 1 (negative)
+        # gate_* parameters in motor units
+        # pulse_*, capt_delay parameters in ms
+        # collect represents which of the four encoders to collect data from
+
+        self._check_setup_args(master, arm_source, direction, gate_width,
+                               gate_step, pulse_width, pulse_step)
+
         # Reset Zebra state
         self.reset.put(1, wait=True)
         time.sleep(0.1)
@@ -640,9 +977,18 @@ class Zebra(ZebraBase):
         disarmed_signal = self.download_status
 
         self._collection_ts = time.time()
+        self._armed_ts = None
+
+        self._stop_download()
+        self._download = None
+        if self.incremental:
+            self._download = ZebraDownload(self)
+            self._download.start()
 
         def armed_status_cb(value, old_value, obj, **kwargs):
             if int(old_value) == 0 and int(value) == 1:
+                # position capture time counts from this edge
+                self._armed_ts = kwargs.get('timestamp')
                 armed_status._finished()
                 obj.clear_sub(armed_status_cb)
 
@@ -655,34 +1001,203 @@ class Zebra(ZebraBase):
         disarmed_signal.subscribe(disarmed_status_cb, run=False)
 
         # Arm it if not External
+        self.arm(external)
+
+        return armed_status
+
+    def arm(self, external=False):
+        """Arm position capture (unless armed externally) and start a
+        timing record for this arm cycle."""
+        self._start_timing(external)
         if not external:
+            self._timing['arm_put'] = time.time()
             self.pos_capt.arm.arm.put(1)
 
-        return armed_status
+    def _start_timing(self, external):
+        if (self._timing is not None
+                and 'download_done' not in self._timing):
+            # the previous cycle never finished downloading
+            self._finish_timing(self._timing, read_counts=False)
+        if not self._timing_subs:
+            for sig in (self.pos_capt.arm.output,
+                        self.pos_capt.arm.input_status,
+                        self.download_status):
+                self._timing_subs.append(
+                    (sig, sig.subscribe(self._timing_edge_cb, run=False)))
+        pc = self.pos_capt
+        self._timing = {
+            'zebra': self.name,
+            'start': time.time(),
+            'external': bool(external),
+            'num_gates': self._config_value(pc.gate.num_gates),
+            'max_pulses': self._config_value(pc.pulse.max_pulses),
+        }
+
+    def _timing_edge_cb(self, value, old_value, obj, **kwargs):
+        record = self._timing
+        if record is None or 'download_done' in record:
+            return
+        try:
+            rising = int(old_value) == 0 and int(value) == 1
+            falling = int(old_value) == 1 and int(value) == 0
+        except (TypeError, ValueError):
+            return
+        pc = self.pos_capt
+        edges = {
+            (pc.arm.output.name, True): 'armed',
+            (pc.arm.output.name, False): 'disarmed',
+            (pc.arm.input_status.name, True): 'arm_input',
+            (self.download_status.name, True): 'download_start',
+            (self.download_status.name, False): 'download_done',
+        }
+        edge = edges.get((obj.name, rising)) if rising or falling else None
+        if edge is None or edge in record:
+            return
+        record[edge] = time.time()
+        if edge == 'download_done':
+            # NUM_CAP/NUM_DOWN are read outside the monitor callback
+            threading.Thread(target=self._finish_timing, args=(record,),
+                             daemon=True).start()
+
+    def _finish_timing(self, record, read_counts=True):
+        """Derive durations and missed edges, log and keep the record."""
+        pc = self.pos_capt
+        if read_counts:
+            try:
+                record['num_captured'] = int(pc.data.num_captured.get())
+                record['num_downloaded'] = int(pc.data.num_downloaded.get())
+            except Exception as error:
+                logger.warning(f"{self.name}: could not read capture "
+                               f"counts: {error}")
+
+        def span(start, end):
+            if start in record and end in record:
+                return record[end] - record[start]
+
+        record['arm_latency'] = span('arm_put', 'armed')
+        record['armed_time'] = span('armed', 'disarmed')
+        record['download_time'] = span('disarmed', 'download_done')
+        record['total'] = span('start', 'download_done')
+        missed = [edge for edge in self._timing_edges if edge not in record]
+        try:
+            expected = int(record['num_gates']) * int(record['max_pulses'])
+        except (TypeError, ValueError):
+            expected = 0
+        if expected and record.get('num_captured', expected) < expected:
+            missed.append('captures')
+        record['missed'] = missed
+        record['done'] = True
+        self.timings.append(record)
+
+        summary = json.dumps({k: v for k, v in record.items() if k != 'done'})
+        if missed:
+            logger.warning(f"{self.name} arm cycle missed {missed}: {summary}")
+        else:
+            logger.info(f"{self.name} arm cycle: {summary}")
+
+    def timings_frame(self):
+        """Timing records as a DataFrame, one row per arm cycle."""
+        return pd.DataFrame(list(self.timings))
+
+    def timing_stats(self, percentiles=(50, 90, 99)):
+        """Percentiles (s) of the arm/disarm/download durations and
+        counts of missed edges over the kept timing records."""
+        frame = self.timings_frame()
+        stats = {}
+        for key in ('arm_latency', 'armed_time', 'download_time', 'total'):
+            values = (frame[key].dropna().to_numpy(dtype=float)
+                      if key in frame else np.empty(0))
+            stats[key] = {'count': len(values)}
+            if len(values):
+                stats[key].update(
+                    {f'p{p}': float(np.percentile(values, p))
+                     for p in percentiles}, max=float(values.max()))
+        stats['missed'] = dict(Counter(
+            edge for missed in frame.get('missed', []) for edge in missed))
+        return stats
+
+    def _stop_download(self):
+        # the fetched rows stay available to collect_pages
+        if self._download is not None:
+            self._download.stop()
+
+    def stop(self, *, success=False):
+        # an aborted or paused scan never reaches complete(): end the
+        # incremental download here
+        self._stop_download()
+        super().stop(success=success)
+
+    def unstage(self):
+        self._stop_download()
+        return super().unstage()
 
     def complete(self):
+        if self._download is not None:
+            return self._download.finish(after=self._disarmed_status)
         return self._disarmed_status
 
-    def collect(self):
+    def _time_scale(self):
+        """Seconds per unit of the captured TIME array (PC_TSPRE)."""
+        units = self._config_value(self.pos_capt.time_units)
+        if units is not None and not isinstance(units, str):
+            enum_strs = getattr(self.pos_capt.time_units, 'enum_strs', None)
+            units = enum_strs[int(units)] if enum_strs else None
+        return self._time_scales.get(units, 1.0)
+
+    def wall_times(self, times):
+        """Wall-clock timestamps for an array of captured TIME values,
+        counted from the armed edge (kickoff time if it was not seen)."""
+        base = self._armed_ts or self._collection_ts
+        return base + np.asarray(times, dtype=float) * self._time_scale()
+
+    def encoder_positions(self, index, values):
+        """Motor positions for a captured ENC<index> array."""
+        if self.raw_encoder_counts:
+            return self.encoder[index].positions(values)
+        return np.asarray(values, dtype=float)
+
+    def aligned_data(self):
+        """(wall times, {encN: motor positions}) of the captured points,
+        trimmed to equal length."""
         pc = self.pos_capt
 
         # Array of timestamps
-        ts = pc.data.time.get() + self._collection_ts
+        ts = self.wall_times(pc.data.time.get())
 
         # Arrays of captured positions
         data = {
-            f'enc{i}': getattr(pc.data, f'enc{i}').get()
+            f'enc{i}': self.encoder_positions(
+                i, getattr(pc.data, f'enc{i}').get())
                 for i in range(1,5)
                 if getattr(pc, f'capture_enc{i}').get()
         }
 
-        for i, timestamp in enumerate(ts):
+        n = min([len(ts)] + [len(v) for v in data.values()])
+        return ts[:n], {k: v[:n] for k, v in data.items()}
+
+    def collect_pages(self):
+        """Captured points as event pages of up to page_size rows, columnar
+        numpy arrays sliced (not copied) from the downloaded waveforms.
+
+        In incremental mode only the rows fetched since the previous call
+        are emitted, so this can be collected repeatedly during the scan.
+        """
+        if self._download is not None:
+            yield from self._download.pages(self.page_size)
+            return
+        ts, data = self.aligned_data()
+        for start in range(0, len(ts), self.page_size):
+            page_ts = ts[start:start + self.page_size]
             yield {
-                'data': { k: v[i] for k, v in data.items() },
-                'timestamps': { k: timestamp for k in data.keys() },
-                'time' : timestamp
+                'data': {k: v[start:start + self.page_size]
+                         for k, v in data.items()},
+                'timestamps': {k: page_ts for k in data},
             }
 
+    if not bluesky_collect_pages:
+        def collect(self):
+            yield from events_from_pages(self.collect_pages())
+
     def describe_collect(self):
         return {
             'primary': {
@@ -696,3 +1211,170 @@ class Zebra(ZebraBase):
 
 zebra1 = Zebra('XF:17IDB-ES:AMX{Zeb:1}:', name='zebra1')
 zebra2 = Zebra('XF:17IDB-ES:AMX{Zeb:2}:', name='zebra2')
+
+
+def bench_zebra_collect(sizes=(10**4, 10**5, 10**6), n_encoders=1):
+    """Document generation throughput of Zebra.collect_pages against the
+    former one-event-per-point collect, on a simulated download.
+
+    Reports the collect generator alone and including composing the
+    documents with event_model, as the RunEngine does (per-row uids and
+    seq_nums are still generated for event pages).
+    """
+    import event_model
+    from ophyd.sim import make_fake_device
+
+    zebra = make_fake_device(Zebra)('SIM:', name='sim_zebra')
+    zebra._collection_ts = time.time()
+    pc = zebra.pos_capt
+    for i in range(1, 5):
+        getattr(pc, f'capture_enc{i}').sim_put(int(i <= n_encoders))
+
+    def collect_per_point():
+        ts, data = zebra.aligned_data()
+        for i, timestamp in enumerate(ts):
+            yield {
+                'data': {k: v[i] for k, v in data.items()},
+                'timestamps': {k: timestamp for k in data.keys()},
+                'time': timestamp
+            }
+
+    results = {}
+    for n in sizes:
+        pc.data.time.sim_put(np.arange(n) * 1e-3)
+        for i in range(1, 5):
+            getattr(pc.data, f'enc{i}').sim_put(np.random.random(n))
+        run = event_model.compose_run()
+        desc = run.compose_descriptor(
+            name='primary',
+            data_keys={f'enc{i}': {'source': 'SIM', 'shape': [],
+                                   'dtype': 'number'}
+                       for i in range(1, n_encoders + 1)})
+
+        timings = {}
+        for key, pages in (('per_point', False), ('pages', True)):
+            collect = zebra.collect_pages if pages else collect_per_point
+            compose = (desc.compose_event_page if pages
+                       else desc.compose_event)
+            t0 = time.perf_counter()
+            docs = list(collect())
+            t1 = time.perf_counter()
+            for doc in docs:
+                compose(data=doc['data'], timestamps=doc['timestamps'],
+                        validate=False)
+            timings[key] = (t1 - t0, time.perf_counter() - t0, len(docs))
+
+        results[n] = timings
+        print(f"{n:>8} points: collect {timings['per_point'][0]:.3f} s -> "
+              f"{timings['pages'][0] * 1e3:.2f} ms, with documents "
+              f"{timings['per_point'][1]:.2f} s -> {timings['pages'][1]:.2f} s "
+              f"({timings['per_point'][2]} events -> "
+              f"{timings['pages'][2]} pages)")
+    return results
+
+
+def bench_zebra_setup(latency=0.05):
+    """Time setup_sequential against the diff-based, concurrent setup on a
+    simulated Zebra with `latency` s per CA put: first configuration,
+    repeating the same configuration, and changing only the gate."""
+    from sim_devices import SimCASignal, make_sim_device
+
+    SimCASignal.latency = latency
+    zebra = make_sim_device(Zebra)('SIM:', name='sim_zebra')
+    kwargs = dict(master=2, arm_source=0, gate_start=-50, gate_width=0.5,
+                  gate_step=1, num_gates=100, direction=0, pulse_width=0.5,
+                  pulse_step=1, capt_delay=0, max_pulses=1,
+                  collect=[False, False, True, False])
+
+    results = {}
+    t0 = time.perf_counter()
+    zebra.setup_sequential(**kwargs)
+    results['sequential'] = time.perf_counter() - t0
+
+    zebra = make_sim_device(Zebra)('SIM:', name='sim_zebra')
+    for key, changes in (('first', {}), ('repeat', {}),
+                         ('new_gate', dict(gate_start=-40, num_gates=80))):
+        kwargs.update(changes)
+        t0 = time.perf_counter()
+        written = zebra.setup(**kwargs)
+        results[key] = time.perf_counter() - t0
+        results[f'{key}_writes'] = len(written)
+
+    print(f"sequential setup {results['sequential']:.3f} s; diff/concurrent: "
+          f"first {results['first']:.3f} s ({results['first_writes']} "
+          f"writes), repeat {results['repeat']:.3f} s "
+          f"({results['repeat_writes']}), new gate {results['new_gate']:.3f} s "
+          f"({results['new_gate_writes']})")
+    return results
+
+
+def bench_zebra_download(n_points=200000, duration=4.0, period=0.2,
+                         bandwidth=20e6, n_encoders=1, poll=0.5):
+    """Simulated fly scan, download-at-end against incremental download:
+    rows collected while the scan runs and the delay from disarm until the
+    last page is out.
+
+    The simulated IOC downloads `n_points` evenly over `duration` s in
+    updates every `period` s; array reads cost a round trip plus their
+    size over `bandwidth` bytes/s. Collection polls every `poll` s, like
+    mirror_scan.
+    """
+    from sim_devices import SimCASignal, make_sim_device
+
+    SimCASignal.latency = 0.005
+    SimCASignal.bandwidth = bandwidth
+    results = {}
+    try:
+        for incremental in (False, True):
+            zebra = make_sim_device(Zebra)('SIM:', name='sim_zebra')
+            zebra.incremental = incremental
+            pc = zebra.pos_capt
+            encs = [getattr(pc.data, f'enc{i}')
+                    for i in range(1, n_encoders + 1)]
+            for i in range(1, 5):
+                getattr(pc, f'capture_enc{i}').put(int(i <= n_encoders))
+            pc.gate.num_gates.put(n_points)
+            pc.pulse.max_pulses.put(1)
+            times = np.linspace(0, duration, n_points)
+            positions = np.linspace(0, 360, n_points)
+            t_disarm = []
+
+            def ioc():
+                n_updates = int(round(duration / period))
+                for k in range(1, n_updates + 1):
+                    time.sleep(period)
+                    n = n_points * k // n_updates
+                    pc.data.time.put(times[:n])
+                    for enc in encs:
+                        enc.put(positions[:n])
+                    pc.data.num_downloaded.put(n)
+                t_disarm.append(time.perf_counter())
+                zebra.download_status.put(0)
+
+            zebra.download_status.put(1)
+            pc.arm.output.put(0)
+            armed = zebra.kickoff()
+            pc.arm.output.put(1)
+            armed.wait()
+            threading.Thread(target=ioc, daemon=True).start()
+            done = zebra.complete()
+            finished = threading.Event()
+            done.add_callback(lambda status: finished.set())
+
+            rows_during = 0
+            while not finished.wait(poll):
+                if incremental:
+                    rows_during += sum(len(page['timestamps']['enc1'])
+                                       for page in zebra.collect_pages())
+            rows = rows_during + sum(len(page['timestamps']['enc1'])
+                                     for page in zebra.collect_pages())
+            latency = time.perf_counter() - t_disarm[0]
+            assert rows == n_points
+
+            key = 'incremental' if incremental else 'at_end'
+            results[key] = {'during': rows_during, 'after_disarm': latency}
+            print(f"{key:>11}: {rows_during}/{n_points} rows collected "
+                  f"during the scan, last page {latency:.2f} s after disarm")
+    finally:
+        SimCASignal.bandwidth = None
+    return results
@@ -0,0 +1,169 @@
+print(f"Loading {__file__}")
+
+import glob
+import json
+import re
+from collections import OrderedDict
+
+zebra_profile_dir = "/nsls2/data/amx/shared/config/zebra_profiles"
+
+# fields that select sources, units or routing; written before the values
+# that are interpreted in them
+_routing_fields = ("source", "time_units", "direction", "input_addr",
+                   "addr", "edge", "input_edge", "armsel")
+
+
+def _profile_stage(attr):
+    field = attr.rsplit(".", 1)[-1]
+    return 0 if field in _routing_fields or field.startswith("capture_") else 1
+
+
+def _getattr_dotted(device, attr):
+    for part in attr.split("."):
+        device = getattr(device, part)
+    return device
+
+
+class ZebraProfileStore:
+    """Named, versioned snapshots of Zebra configurations.
+
+    A profile is a JSON file `<root>/<zebra name>/<profile>.v<NNN>.json`
+    holding {dotted attribute: value}. Every snapshot writes a new version;
+    load/diff/restore use the latest unless a version is given.
+
+    Live values for diff/restore come from the Zebra's configuration
+    monitors (see Zebra._config_value), so after the first use comparing a
+    profile costs no CA traffic and restoring writes only what differs,
+    concurrently, routing fields first.
+    """
+
+    def __init__(self, root=zebra_profile_dir):
+        self.root = root
+
+    def _path(self, zebra, name, version):
+        return os.path.join(self.root, zebra.name, f"{name}.v{version:03d}.json")
+
+    def versions(self, zebra, name):
+        pattern = os.path.join(self.root, zebra.name, f"{name}.v*.json")
+        return sorted(int(re.search(r"\.v(\d+)\.json$", path).group(1))
+                      for path in glob.glob(pattern))
+
+    def profiles(self, zebra):
+        names = {os.path.basename(path).rsplit(".v", 1)[0] for path in
+                 glob.glob(os.path.join(self.root, zebra.name, "*.json"))}
+        return sorted(names)
+
+    @staticmethod
+    def default_attrs(zebra):
+        """Dotted names of the Zebra's writable configuration signals."""
+        dotted = {walk.item.name: walk.dotted_name
+                  for walk in zebra.walk_signals()}
+        return [dotted[key] for key in zebra.describe_configuration()
+                if key in dotted and not isinstance(
+                    _getattr_dotted(zebra, dotted[key]), EpicsSignalRO)]
+
+    def snapshot(self, zebra, name, attrs=None, description=""):
+        """Save the current configuration as a new version of `name`.
+
+        attrs defaults to default_attrs(zebra); pass extra dotted names for
+        signals outside the configuration (e.g. ZebraMXOr or3/armsel)."""
+        attrs = self.default_attrs(zebra) if attrs is None else list(attrs)
+        values = {}
+        for attr in attrs:
+            value = _getattr_dotted(zebra, attr).get()
+            values[attr] = value.item() if hasattr(value, "item") else value
+        version = (self.versions(zebra, name) or [0])[-1] + 1
+        profile = {"zebra": zebra.name, "prefix": zebra.prefix, "name": name,
+                   "version": version, "time": ttime.time(),
+                   "description": description, "values": values}
+        path = self._path(zebra, name, version)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(profile, f, indent=1)
+        return version
+
+    def load(self, zebra, name, version=None):
+        if version is None:
+            versions = self.versions(zebra, name)
+            if not versions:
+                raise FileNotFoundError(
+                    f"no profile '{name}' for {zebra.name} in {self.root}")
+            version = versions[-1]
+        with open(self._path(zebra, name, version)) as f:
+            return json.load(f)
+
+    def diff(self, zebra, name, version=None):
+        """{attr: (live value, profile value)} for fields that differ."""
+        values = self.load(zebra, name, version)["values"]
+        out = OrderedDict()
+        for attr in sorted(values, key=_profile_stage):
+            sig = _getattr_dotted(zebra, attr)
+            if zebra._differs(sig, values[attr]):
+                out[attr] = (zebra._config_value(sig), values[attr])
+        return out
+
+    def stage_sigs(self, zebra, name, version=None, prefix=""):
+        """Differences as an ordered stage_sigs mapping, routing fields
+        first; use prefix="zebra." when the Zebra is a child device."""
+        return OrderedDict(
+            (prefix + attr, value) for attr, (_, value)
+            in self.diff(zebra, name, version).items())
+
+    def restore(self, zebra, name, version=None):
+        """Write the fields that differ from the profile; returns them."""
+        changes = self.diff(zebra, name, version)
+        for stage in (0, 1):
+            put_concurrently(
+                [(_getattr_dotted(zebra, attr), value)
+                 for attr, (_, value) in changes.items()
+                 if _profile_stage(attr) == stage])
+        return list(changes)
+
+
+zebra_profiles = ZebraProfileStore()
+
+
+def bench_zebra_profiles(latency=0.05, path="/tmp/zebra_profiles_bench"):
+    """Switch a simulated Zebra between two profiles: restore (differences
+    only, concurrent) against writing the whole profile in sequence."""
+    from sim_devices import SimCASignal, make_sim_device
+
+    SimCASignal.latency = latency
+    store = ZebraProfileStore(path)
+    zebra = make_sim_device(Zebra)("SIM:", name="sim_zebra")
+    # the simulated gate/pulse signals are not EpicsSignals, so they drop
+    # out of the default configuration; list them explicitly
+    attrs = store.default_attrs(zebra) + [
+        f"pos_capt.{dev}.{field}"
+        for dev, fields in (("gate", ("num_gates", "start", "width", "step")),
+                            ("pulse", ("max_pulses", "start", "width",
+                                       "step", "delay")))
+        for field in fields]
+
+    zebra.setup(master=3, arm_source=0, gate_start=0.5, gate_width=4.5,
+                gate_step=9, num_gates=20, direction=0, pulse_width=4,
+                pulse_step=5, capt_delay=0, max_pulses=1)
+    store.snapshot(zebra, "top_align", attrs)
+    zebra.setup(master=2, arm_source=0, gate_start=-50, gate_width=0.5,
+                gate_step=1, num_gates=100, direction=1, pulse_width=0.5,
+                pulse_step=1, capt_delay=0, max_pulses=1,
+                collect=[False, False, True, False])
+    store.snapshot(zebra, "mirror_scan", attrs)
+    values = store.load(zebra, "top_align")["values"]
+
+    t0 = time.perf_counter()
+    for attr in sorted(values, key=_profile_stage):
+        _getattr_dotted(zebra, attr).put(values[attr], wait=True)
+    full = time.perf_counter() - t0
+
+    store.restore(zebra, "mirror_scan")
+    t0 = time.perf_counter()
+    written = store.restore(zebra, "top_align")
+    fast = time.perf_counter() - t0
+    assert not store.diff(zebra, "top_align")
+
+    print(f"switch to top_align: {len(values)} fields in sequence "
+          f"{full:.2f} s, restore {len(written)} differing fields "
+          f"{fast * 1e3:.0f} ms")
+    return {"full": full, "restore": fast, "fields": len(values),
+            "written": len(written)}
@@ -0,0 +1,274 @@
+print(f"Loading {__file__}")
+
+import glob
+import socket
+import sqlite3
+from collections import Counter
+
+# one SQLite file per session in this directory, see RobotTaskLog
+robot_task_dir = "/nsls2/data/amx/shared/config/robot/robot_tasks"
+
+# commands of each operation when no recovery branch runs
+nominal_commands = {name: sequence.commands
+                    for name, sequence in robot_sequences.items()}
+nominal_commands["recover"] = ["Recover", "TraceSample"]
+nominal_commands.update(robot_tasks)
+
+_robot_task_schema = """
+CREATE TABLE IF NOT EXISTS operations (
+    id INTEGER PRIMARY KEY, name TEXT, sample INTEGER, start REAL,
+    duration REAL, error TEXT);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY, command TEXT, start REAL, duration REAL,
+    status TEXT, exception TEXT, timeout REAL, operation INTEGER
+    REFERENCES operations(id));
+CREATE INDEX IF NOT EXISTS tasks_command_start ON tasks (command, start);
+"""
+
+
+class RobotTaskLog:
+    """Append-only SQLite record of robot tasks and the operations
+    (mount, unmount, run_task, ...) that ran them.
+
+    Robot.run_and_wait records every task with its start (epoch seconds),
+    duration, status (Done/ABORT/..., TIMEOUT or ERROR when it raised) and
+    exception; methods decorated with robot_operation group their tasks.
+    Recording never raises: failures to write are logged and dropped.
+
+    Each session writes its own file, robot_tasks_<host>_<pid>.sqlite in
+    `directory`, so no two processes ever write the same database (SQLite
+    locking is not reliable on NFS). The queries read every session's file
+    in the directory and merge them; operation ids are per file, so their
+    rows carry a `session` column.
+
+    Times given to the queries (since/until) are epoch seconds or anything
+    pd.Timestamp understands, in local time.
+    """
+
+    def __init__(self, directory=robot_task_dir):
+        self.directory = directory
+        self.session = f"{socket.gethostname()}_{os.getpid()}"
+        self.path = os.path.join(directory,
+                                 f"robot_tasks_{self.session}.sqlite")
+        self._schema_done = False
+
+    def _connect(self):
+        if not self._schema_done:
+            os.makedirs(self.directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        if not self._schema_done:
+            conn.executescript(_robot_task_schema)
+            self._schema_done = True
+        return conn
+
+    def _write(self, sql, params):
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    return conn.execute(sql, params).lastrowid
+            finally:
+                conn.close()
+        except (OSError, sqlite3.Error) as exc:
+            logger.warning(f"Robot task log {self.path} not written: {exc}")
+
+    def start_operation(self, name, start, sample=None):
+        """Row id of a new operation, None if it could not be written."""
+        return self._write(
+            "INSERT INTO operations (name, sample, start) VALUES (?, ?, ?)",
+            (name, sample, start))
+
+    def finish_operation(self, operation, duration, error=""):
+        if operation is not None:
+            self._write(
+                "UPDATE operations SET duration = ?, error = ? WHERE id = ?",
+                (duration, error, operation))
+
+    def record_task(self, command, start, duration, status, exception="",
+                    timeout=None, operation=None):
+        self._write(
+            "INSERT INTO tasks (command, start, duration, status, exception,"
+            " timeout, operation) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (command, start, duration, status, exception, timeout,
+             operation))
+
+    @staticmethod
+    def _epoch(t):
+        if t is None or isinstance(t, (int, float)):
+            return t
+        return time.mktime(pd.Timestamp(t).timetuple())
+
+    def _query(self, table, since=None, until=None, where="", params=()):
+        sql = f"SELECT * FROM {table} WHERE start >= ? AND start < ?"
+        params = (self._epoch(since) or 0,
+                  self._epoch(until) or float("inf")) + tuple(params)
+        frames = []
+        pattern = os.path.join(self.directory, "robot_tasks_*.sqlite")
+        for path in sorted(glob.glob(pattern)):
+            try:
+                conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True,
+                                       timeout=10)
+                try:
+                    df = pd.read_sql_query(sql + where, conn, params=params)
+                finally:
+                    conn.close()
+            except (pd.errors.DatabaseError, sqlite3.Error) as exc:
+                logger.warning(f"Robot task log {path} not read: {exc}")
+                continue
+            session = os.path.basename(path)[len("robot_tasks_"):]
+            frames.append(df.assign(session=session[:-len(".sqlite")]))
+        if not frames:
+            conn = sqlite3.connect(":memory:")
+            try:
+                conn.executescript(_robot_task_schema)
+                df = pd.read_sql_query(f"SELECT * FROM {table}", conn)
+            finally:
+                conn.close()
+            frames.append(df.assign(session="").astype(
+                {"start": float, "duration": float}))
+        df = pd.concat(frames, ignore_index=True)
+        df = df.sort_values("start", ignore_index=True)
+        df["time"] = pd.to_datetime(
+            df["start"].map(dt.datetime.fromtimestamp))
+        return df
+
+    def tasks(self, since=None, until=None, command=None):
+        """Recorded tasks as a DataFrame, oldest first."""
+        if command is None:
+            return self._query("tasks", since, until)
+        return self._query("tasks", since, until, " AND command = ?",
+                           (command,))
+
+    def operations(self, since=None, until=None, name=None):
+        """Recorded operations with the commands they ran, oldest first;
+        `recovered` marks operations that ran commands beyond
+        nominal_commands, i.e. where a recovery branch ran."""
+        if name is None:
+            ops = self._query("operations", since, until)
+        else:
+            ops = self._query("operations", since, until, " AND name = ?",
+                              (name,))
+        tasks = self.tasks(since, until)
+        commands = tasks.groupby(["session", "operation"])["command"].agg(
+            list)
+        ops["commands"] = [commands.get(key, [])
+                           for key in zip(ops["session"], ops["id"])]
+        # steps can be skipped (warmup=False, init=False, ...), a recovery
+        # branch runs commands beyond the nominal ones
+        ops["recovered"] = [
+            op in nominal_commands and
+            bool(Counter(cmds) - Counter(nominal_commands[op]))
+            for op, cmds in zip(ops["name"], ops["commands"])]
+        return ops
+
+    @staticmethod
+    def _percentiles(groups, percentiles):
+        if not groups.ngroups:
+            return pd.DataFrame(
+                columns=["count"] + [f"p{p:g}" for p in percentiles])
+        stats = groups["duration"].quantile([p / 100 for p in percentiles])
+        stats = stats.unstack()
+        stats.columns = [f"p{p:g}" for p in percentiles]
+        stats.insert(0, "count", groups.size())
+        return stats
+
+    def command_stats(self, since=None, until=None,
+                      percentiles=(50, 90, 99)):
+        """Per-command count, duration percentiles (s) and failures, the
+        commands taking the most total time first."""
+        tasks = self.tasks(since, until)
+        groups = tasks.groupby("command")
+        stats = self._percentiles(groups, percentiles)
+        stats["total"] = groups["duration"].sum()
+        stats["failed"] = groups["status"].agg(
+            lambda s: (s.str.lower() != "done").sum())
+        return stats.sort_values("total", ascending=False)
+
+    def trend(self, command, freq="1D", since=None, until=None,
+              percentiles=(50, 90)):
+        """Duration percentiles of one command per `freq` period, to spot
+        a step slowing down."""
+        tasks = self.tasks(since, until, command).set_index("time")
+        groups = tasks.resample(freq)
+        return self._percentiles(groups, percentiles).dropna()
+
+    def step_shares(self, name="mount", since=None, until=None):
+        """Share of each command in the total time of operations `name`:
+        which steps dominate e.g. sample exchange."""
+        ops = self.operations(since, until, name)
+        tasks = self.tasks(since, until)
+        keys = set(zip(ops["session"], ops["id"]))
+        tasks = tasks[[key in keys for key in
+                       zip(tasks["session"], tasks["operation"])]]
+        total = tasks.groupby("command")["duration"].sum()
+        return (total / total.sum()).sort_values(ascending=False)
+
+    def recoveries(self, since=None, until=None):
+        """Per operation: how many ran, how many took a recovery branch or
+        failed, and the most common error."""
+        ops = self.operations(since, until)
+        failed = ops["error"].fillna("") != ""
+        groups = ops.assign(failed=failed).groupby("name")
+        return pd.DataFrame({
+            "count": groups.size(),
+            "recovered": groups["recovered"].sum(),
+            "failed": groups["failed"].sum(),
+            "top_error": groups["error"].agg(
+                lambda s: s[s.fillna("") != ""].mode().iat[0]
+                if (s.fillna("") != "").any() else ""),
+        })
+
+
+robot_task_log = RobotTaskLog()
+robrob.task_log = robot_task_log
+
+
+def bench_robot_faults(prefix=sim_robot_prefix, n_exchanges=20,
+                       fault_rate=0.05, jitter=0.2, task_time=0.02, seed=0,
+                       directory=None):
+    """Mount and unmount `n_exchanges` samples on the simulated robot
+    (sim/embl_robot_ioc.py) with random faults and jittered task times,
+    recording to a RobotTaskLog in `directory` (a temporary one by
+    default).
+
+    After a RobotError the simulator's sample is cleared and the next
+    exchange starts. Prints exchanges per hour and recoveries(); returns
+    the log for further queries. Refuses to run unless `prefix` serves the
+    simulator's SIM: PVs.
+    """
+    import tempfile
+
+    sim = {name: EpicsSignal(prefix + f"SIM:{name}", name=f"sim_{name}")
+           for name in ("TaskTime", "TaskJitter", "FaultRate", "Seed",
+                        "ClearSample")}
+    try:
+        sim["TaskTime"].wait_for_connection(timeout=2)
+    except TimeoutError:
+        raise RuntimeError(f"{prefix} is not a simulated robot") from None
+    for name, value in (("TaskTime", task_time), ("TaskJitter", jitter),
+                        ("Seed", seed), ("FaultRate", fault_rate)):
+        sim[name].put(value, wait=True)
+    if directory is None:
+        directory = tempfile.mkdtemp()
+    robot = Robot(prefix, name="sim_robot")
+    robot.wait_for_connection(timeout=5)
+    robot.task_log = log = RobotTaskLog(directory)
+
+    t0 = ttime.perf_counter()
+    failed = 0
+    try:
+        for k in range(n_exchanges):
+            try:
+                robot.mount(k % 48 + 1, timeout=100000)
+                robot.unmount(k % 48 + 1, timeout=100000)
+            except RobotError as exc:
+                failed += 1
+                logger.info(f"Exchange {k} failed: {exc}")
+                sim["ClearSample"].put(1, wait=True)
+    finally:
+        sim["FaultRate"].put(0, wait=True)
+    elapsed = ttime.perf_counter() - t0
+    print(f"{n_exchanges} exchanges, {failed} failed, in {elapsed:.1f} s: "
+          f"{n_exchanges / elapsed * 3600:.0f} exchanges/h")
+    print(log.recoveries())
+    return log
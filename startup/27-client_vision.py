@@ -0,0 +1,327 @@
+print(f"Loading {__file__}")
+
+from ophyd.device import DynamicDeviceComponent as DDC
+import threading
+
+try:
+    import cv2
+except ImportError:
+    # only ClientVision needs OpenCV, keep the session loading without it
+    cv2 = None
+
+
+def _prepare(frame, blur=0):
+    """Grayscale and box-blur a frame, as ADCompVision does first."""
+    if cv2 is None:
+        raise RuntimeError("client-side vision needs OpenCV (cv2)")
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+    if blur > 1:
+        frame = cv2.blur(frame, (blur, blur))
+    return frame
+
+
+def threshold_centroid(frame, threshold=50, blur=5, min_size=1000,
+                       max_size=40000):
+    """Centroid of the largest blob above threshold with min_size <= area
+    <= max_size (ADCompVision "Centroid Identification").
+
+    y is measured from the bottom of the frame, like the IOC output, see
+    measure_opening_dist. All outputs are NaN if no blob qualifies.
+    """
+    img = _prepare(frame, blur)
+    mask = (img > threshold).view(np.uint8)
+    _, _, stats, centroids = cv2.connectedComponentsWithStats(mask)
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    ok = np.flatnonzero((areas >= min_size) & (areas <= max_size))
+    if not len(ok):
+        return {"x": np.nan, "y": np.nan, "area": 0}
+    k = ok[areas[ok].argmax()] + 1
+    x, y = centroids[k]
+    return {"x": x, "y": img.shape[0] - y, "area": int(stats[k, 4])}
+
+
+def _canny(frame, threshold, ratio, blur, sobel):
+    img = _prepare(frame, blur)
+    if img.dtype != np.uint8:
+        img = cv2.convertScaleAbs(img, alpha=255.0 / max(img.max(), 1))
+    return cv2.Canny(img, threshold, threshold * ratio, apertureSize=sobel)
+
+
+def canny_extents(frame, threshold=20, ratio=3, blur=3, sobel=3):
+    """Top/bottom/left/right pixel of the Canny edges (ADCompVision "Canny
+    Edge Detection"), -1 if there are no edges."""
+    edges = _canny(frame, threshold, ratio, blur, sobel)
+    rows = np.flatnonzero(edges.any(axis=1))
+    cols = np.flatnonzero(edges.any(axis=0))
+    if not len(rows):
+        return {"top": -1, "bottom": -1, "left": -1, "right": -1}
+    return {"top": rows[0], "bottom": rows[-1],
+            "left": cols[0], "right": cols[-1]}
+
+
+def pin_tip(frame, method="canny", threshold=20, ratio=3, blur=3, sobel=3,
+            side="left", profile_width=50):
+    """Tip of the pin/loop and its vertical profile near the tip.
+
+    The object is segmented with Canny edges (method="canny") or a plain
+    threshold ("threshold"); the tip is its extreme column on `side`, tip y
+    the middle of the object in that column and profile its vertical extent
+    over the `profile_width` columns behind the tip. -1 if nothing is found.
+    """
+    if method == "canny":
+        mask = _canny(frame, threshold, ratio, blur, sobel)
+    else:
+        mask = _prepare(frame, blur) > threshold
+    cols = np.flatnonzero(mask.any(axis=0))
+    if not len(cols):
+        return {"x": -1, "y": -1, "profile": -1}
+    if side == "left":
+        tip = cols[0]
+        behind = mask[:, tip:tip + profile_width]
+    else:
+        tip = cols[-1]
+        behind = mask[:, max(tip - profile_width + 1, 0):tip + 1]
+    tip_rows = np.flatnonzero(mask[:, tip])
+    rows = np.flatnonzero(behind.any(axis=1))
+    return {"x": tip, "y": 0.5 * (tip_rows[0] + tip_rows[-1]),
+            "profile": rows[-1] - rows[0]}
+
+
+# mode -> [(operation, parameters, {result: output})], parameters follow the
+# cv1 stage_sigs of the corresponding cam_mode.
+client_vision_modes = {
+    "centroid": [
+        (threshold_centroid,
+         dict(threshold=30, blur=5, min_size=5000, max_size=3000000),
+         {"x": "output1", "y": "output2", "area": "output3"}),
+    ],
+    "beam_align": [
+        (threshold_centroid,
+         dict(threshold=50, blur=5, min_size=1000, max_size=40000),
+         {"x": "output1", "y": "output2", "area": "output3"}),
+    ],
+    "edge_detection": [
+        (canny_extents, dict(threshold=20, ratio=8, blur=9, sobel=5),
+         {"top": "output5", "bottom": "output6",
+          "left": "output7", "right": "output8"}),
+    ],
+    "rot_align_contour": [
+        (pin_tip, dict(method="threshold", threshold=42, blur=7),
+         {"x": "output1", "y": "output2"}),
+    ],
+    "coarse_align": [
+        (pin_tip, dict(method="canny", threshold=8, ratio=3, blur=1,
+                       sobel=3),
+         {"x": "output8", "y": "output9", "profile": "output10"}),
+    ],
+}
+
+
+# mode -> camera plugins cv1 reads through in that cam_mode, in order (see
+# the cam_mode stage_sigs). ClientVision applies their current transform
+# and ROI settings to the raw frames, so positions and sizes come out in the
+# same pixel frame as the IOC outputs. Processing plugins (PROC1, CC1) do
+# not move pixels and are left out.
+client_vision_chains = {
+    "centroid": [],
+    "beam_align": ["roi1"],
+    "edge_detection": ["roi4"],
+    "rot_align_contour": ["roi1"],
+    "coarse_align": ["trans1", "roi2"],
+}
+
+
+def apply_transform(frame, transform):
+    """NDPluginTransform type (0-7 or its name): rotations are clockwise,
+    the Mirror types mirror X after rotating."""
+    types = ["None", "Rot90", "Rot180", "Rot270", "Mirror", "Rot90Mirror",
+             "Rot180Mirror", "Rot270Mirror"]
+    if isinstance(transform, str):
+        transform = types.index(transform)
+    frame = np.rot90(frame, -(transform % 4))
+    if transform >= 4:
+        frame = frame[:, ::-1]
+    return frame
+
+
+def apply_roi(frame, min_x, min_y, size_x, size_y, bin_x=1, bin_y=1,
+              reverse_x=False, reverse_y=False, scale=None):
+    """NDPluginROI on one frame: crop, sum-bin (divided by `scale` if
+    given, saturating in the frame's dtype) and reverse X/Y. A size of None
+    keeps the rest of that axis."""
+    frame = frame[min_y:None if size_y is None else min_y + size_y,
+                  min_x:None if size_x is None else min_x + size_x]
+    if bin_x > 1 or bin_y > 1:
+        h = frame.shape[0] // bin_y * bin_y
+        w = frame.shape[1] // bin_x * bin_x
+        frame = frame[:h, :w]
+        binned = frame.reshape(
+            (h // bin_y, bin_y, w // bin_x, bin_x) + frame.shape[2:]
+        ).sum(axis=(1, 3), dtype=float)
+        if scale:
+            binned /= scale
+        if frame.dtype.kind in "ui":
+            limits = np.iinfo(frame.dtype)
+            binned = np.clip(binned, limits.min, limits.max)
+        frame = binned.astype(frame.dtype)
+    if reverse_x:
+        frame = frame[:, ::-1]
+    if reverse_y:
+        frame = frame[::-1]
+    return frame
+
+
+class ClientVision(Device):
+    """CVPlugin-compatible outputs computed in Python from grabbed frames.
+
+    Runs the operations of one or more `client_vision_modes` on each new
+    frame of a FrameGrabber and writes the results to outputs.output1-10,
+    the same layout as CVPlugin, so read_attrs such as
+    ["outputs.output8", "outputs.output9"] and plan code reading
+    `det.outputs.outputN.name` work unchanged. Changing `mode` (a list of
+    mode names) is a local assignment, no CA puts.
+
+    With `camera` given, each mode first applies the transform and ROI
+    plugins of its `client_vision_chains` entry, read from the camera on
+    stage(), so outputs are in the pixel frame of the IOC's cv1.
+
+    trigger() processes the first frame that arrives after it is called, so
+    count alongside the camera: bp.count([cam_7, cam_7_vision]).
+    """
+
+    _default_read_attrs = ["outputs"]
+    outputs = DDC(
+        {f"output{k}": (Signal, None, {"value": np.nan})
+         for k in range(1, 11)}
+    )
+    mode = Cpt(Signal, value=["centroid"], kind="config")
+    roi = Cpt(Signal, value=None, kind="config",
+              doc="(min_x, min_y, size_x, size_y) or None for full frame")
+
+    def __init__(self, *args, grabber, camera=None, frame_timeout=10,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.grabber = grabber
+        self.camera = camera
+        self.frame_timeout = frame_timeout
+        self._started_grabber = False
+        self._chain_steps = {}
+        self._transform_types = {}
+
+    def _modes(self):
+        modes = self.mode.get()
+        if isinstance(modes, str):
+            modes = [modes]
+        return modes
+
+    def operations(self):
+        modes = self._modes()
+        ops = [op for mode in modes for op in client_vision_modes[mode]]
+        outputs = [out for _, _, mapping in ops for out in mapping.values()]
+        if len(outputs) != len(set(outputs)):
+            raise ValueError(f"vision modes {modes} share output signals")
+        return ops
+
+    def _transform_type(self, plugin):
+        # the TransformPlugin class in use predates the single Type record
+        if plugin.prefix not in self._transform_types:
+            self._transform_types[plugin.prefix] = EpicsSignalRO(
+                plugin.prefix + "Type", string=True,
+                name=f"{plugin.name}_type")
+        return self._transform_types[plugin.prefix].get()
+
+    def read_chain(self, mode):
+        """Current transform/ROI steps of `mode`'s plugin chain."""
+        steps = []
+        if self.camera is None:
+            return steps
+        for attr in client_vision_chains.get(mode, ()):
+            plugin = getattr(self.camera, attr)
+            if isinstance(plugin, TransformPlugin):
+                steps.append((apply_transform,
+                              dict(transform=self._transform_type(plugin))))
+                continue
+            enabled = [plugin.roi_enable.x.get() == "Enable",
+                       plugin.roi_enable.y.get() == "Enable"]
+            roi = dict(min_x=0, min_y=0, size_x=None, size_y=None)
+            for axis, on in zip("xy", enabled):
+                if on:
+                    roi.update({
+                        f"min_{axis}": int(getattr(
+                            plugin.min_xyz, f"min_{axis}").get()),
+                        f"size_{axis}": int(getattr(plugin.size, axis).get()),
+                        f"bin_{axis}": int(getattr(plugin.bin_, axis).get()),
+                        f"reverse_{axis}": bool(getattr(
+                            plugin.reverse, axis).get()),
+                    })
+            if plugin.enable_scale.get() == "Enable":
+                roi["scale"] = float(plugin.scale.get())
+            steps.append((apply_roi, roi))
+        return steps
+
+    def process(self, frame, timestamp=None):
+        """Run all operations of the current mode(s) on one frame."""
+        roi = self.roi.get()
+        if roi is not None:
+            x0, y0, w, h = roi
+            frame = frame[y0:y0 + h, x0:x0 + w]
+        timestamp = timestamp or ttime.time()
+        results = {}
+        for mode in self._modes():
+            mode_frame = frame
+            steps = self._chain_steps.get(mode)
+            if steps is None:
+                steps = self.read_chain(mode)
+            for func, params in steps:
+                mode_frame = func(mode_frame, **params)
+            for func, params, mapping in client_vision_modes[mode]:
+                out = func(mode_frame, **params)
+                for key, output in mapping.items():
+                    results[output] = float(out[key])
+                    getattr(self.outputs, output).put(
+                        results[output], timestamp=timestamp)
+        return results
+
+    def stage(self):
+        self.operations()
+        self._chain_steps = {mode: self.read_chain(mode)
+                             for mode in self._modes()}
+        if not self.grabber.running:
+            self.grabber.start()
+            self._started_grabber = True
+        return super().stage()
+
+    def unstage(self):
+        self._chain_steps = {}
+        if self._started_grabber:
+            self.grabber.stop()
+            self._started_grabber = False
+        return super().unstage()
+
+    def trigger(self):
+        status = DeviceStatus(self)
+        after = self.grabber.buffer.count
+
+        def process_next():
+            try:
+                frame, _, timestamp = self.grabber.wait_for_frame(
+                    timeout=self.frame_timeout, after=after)
+                self.process(frame, timestamp)
+            except Exception as error:
+                status.set_exception(error)
+            else:
+                status.set_finished()
+
+        threading.Thread(target=process_next, daemon=True).start()
+        return status
+
+
+cam_6_vision = ClientVision(
+    name="cam_6_vision", grabber=frame_grabbers["cam_6"], camera=cam_6)
+cam_7_vision = ClientVision(
+    name="cam_7_vision", grabber=frame_grabbers["cam_7"], camera=cam_7)
+xeye_vision = ClientVision(
+    name="xeye_vision", grabber=frame_grabbers["xeye"], camera=xeye)
+xeye_vision.mode.put(["coarse_align"])
+xeye_vision.outputs.read_attrs = ["output8", "output9", "output10"]
@@ -11,3 +11,286 @@ print(f"Loading {__file__}")
 
 gov = _make_governors("XF:17IDB-ES:AMX", name="gov")
 gov_rbt = gov.gov.Robot
+
+import heapq
+import json
+import logging
+from collections import defaultdict
+
+from ophyd.status import DeviceStatus, SubscriptionStatus
+
+logger = logging.getLogger(__name__)
+
+governor_graph_file = "/nsls2/data/amx/shared/config/governor/robot_graph.json"
+
+
+class GovernorClient:
+    """Transition graph of a governor learned from its monitors, and routes
+    through it.
+
+    The `state` and `reachable` monitors record, for every state the
+    governor settles in, the states reachable from it, and the duration of
+    every transition (leaving a state for `moving_state` until arriving at
+    the next). The graph and the last `keep` durations per transition are
+    saved to `path` so they survive restarts: never from the monitor
+    callbacks, but by save(), which a background timer runs `save_delay` s
+    after the first unsaved change. save() merges with what other sessions
+    wrote to the file (their durations are kept, states seen here replace
+    theirs) and replaces it atomically.
+
+    `state` and `reachable` are kept current by the monitors, so checks
+    on them cost no CA round trip; left_moving() waits for the governor to
+    settle.
+
+    route(target) is the fastest known sequence of states to target, by
+    median measured duration (`default_duration` s for transitions not
+    timed yet); set(target) runs it hop by hop and returns a DeviceStatus,
+    so plans can ask for a destination:
+
+        yield from bps.abs_set(gov_rbt_client, "SA", wait=True)
+
+    With `prefer_direct` (the default) set() asks the governor for target
+    directly whenever it is reachable from the current state, exactly as
+    bps.abs_set(gov_rbt, target) does, and only routes through intermediate
+    states when there is no direct transition.
+    """
+
+    def __init__(self, governor, name=None, moving_state="M",
+                 path=governor_graph_file, default_duration=5.0, keep=50,
+                 hop_timeout=60, save_delay=60, prefer_direct=True):
+        self.governor = governor
+        self.name = name or f"{governor.name}_client"
+        self.moving_state = moving_state
+        self.prefer_direct = prefer_direct
+        self.path = path
+        self.default_duration = default_duration
+        self.keep = keep
+        self.hop_timeout = hop_timeout
+        self.save_delay = save_delay
+        self.edges = {}
+        self.durations = defaultdict(list)
+        self._lock = threading.Lock()
+        self._left = None
+        # changes not saved yet: states whose reachable set was seen and
+        # durations measured here
+        self._new_edges = {}
+        self._new_durations = defaultdict(list)
+        self._save_timer = None
+        self.load()
+        self.state = None
+        self.reachable = []
+        governor.state.subscribe(self._state_changed, event_type="value")
+        governor.reachable.subscribe(self._reachable_changed,
+                                     event_type="value")
+
+    @staticmethod
+    def _states(value):
+        if isinstance(value, str):
+            return value.replace(",", " ").split()
+        return [str(v) for v in value if v]
+
+    def _state_changed(self, value, old_value=None, timestamp=None,
+                       **kwargs):
+        now = timestamp or ttime.time()
+        with self._lock:
+            self.state = value
+            if value == self.moving_state:
+                if old_value is not None and old_value != value:
+                    self._left = (old_value, now)
+                return
+            if self._left is not None:
+                source, start = self._left
+                self._left = None
+                if source != value:
+                    times = self.durations[(source, value)]
+                    times.append(now - start)
+                    del times[:-self.keep]
+                    self._new_durations[(source, value)].append(now - start)
+                    if value not in self.edges.setdefault(source, []):
+                        self.edges[source].append(value)
+                        self._new_edges[source] = list(self.edges[source])
+                    self._schedule_save()
+
+    def _reachable_changed(self, value, **kwargs):
+        states = self._states(value)
+        with self._lock:
+            self.reachable = states
+            if (states and self.state is not None
+                    and self.state != self.moving_state
+                    and states != self.edges.get(self.state)):
+                self.edges[self.state] = states
+                self._new_edges[self.state] = states
+                self._schedule_save()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return {}, {}
+        durations = {}
+        for key, times in saved.get("durations", {}).items():
+            source, target = key.split(">")
+            durations[(source, target)] = times
+        return saved.get("edges", {}), durations
+
+    def load(self):
+        edges, durations = self._read()
+        with self._lock:
+            self.edges.update(edges)
+            self.durations.update(durations)
+
+    def _schedule_save(self):
+        # called with the lock held, from the monitor callbacks
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(self.save_delay, self.save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def save(self):
+        """Merge the changes seen here into the file at `path`."""
+        with self._lock:
+            self._save_timer = None
+            new_edges, self._new_edges = self._new_edges, {}
+            new_durations = self._new_durations
+            self._new_durations = defaultdict(list)
+        if not new_edges and not new_durations:
+            return
+        edges, durations = self._read()
+        edges.update(new_edges)
+        for key, times in new_durations.items():
+            durations[key] = (durations.get(key, []) + times)[-self.keep:]
+        saved = {"edges": edges,
+                 "durations": {f"{s}>{t}": times for (s, t), times
+                               in durations.items()}}
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(saved, f, indent=1)
+            os.replace(tmp, self.path)
+        except OSError as exc:
+            logger.warning(f"Governor graph {self.path} not written: {exc}")
+            return
+        with self._lock:
+            for state, targets in edges.items():
+                self.edges.setdefault(state, targets)
+            for key, times in durations.items():
+                if key not in self.durations:
+                    self.durations[key] = times
+
+    def duration(self, source, target):
+        """Median measured duration of source -> target in seconds."""
+        times = self.durations.get((source, target))
+        return float(np.median(times)) if times else self.default_duration
+
+    def route(self, target, source=None):
+        """Fastest known list of states from `source` (the current state)
+        to `target`, excluding source; None if target is not known to be
+        reachable."""
+        with self._lock:
+            source = source or self.state
+            edges = {s: list(t) for s, t in self.edges.items()}
+            if source == self.state:
+                edges[source] = list(self.reachable)
+        best = {source: 0.0}
+        queue = [(0.0, source, [])]
+        while queue:
+            cost, state, path = heapq.heappop(queue)
+            if state == target:
+                return path
+            if cost > best.get(state, float("inf")):
+                continue
+            for nxt in edges.get(state, []):
+                new = cost + self.duration(state, nxt)
+                if new < best.get(nxt, float("inf")):
+                    best[nxt] = new
+                    heapq.heappush(queue, (new, nxt, path + [nxt]))
+        return None
+
+    def left_moving(self, timeout=None):
+        """Status finishing when the governor is in a state other than
+        `moving_state`, at once if it already is."""
+        return SubscriptionStatus(
+            self.governor.state,
+            lambda value, **kwargs: value != self.moving_state,
+            timeout=timeout)
+
+    def set(self, value, **kwargs):
+        """Move the governor to state `value`: directly if it is reachable
+        and `prefer_direct`, else along route(value); without a known route
+        the governor is asked for it directly."""
+        status = DeviceStatus(self.governor)
+        if value == self.state:
+            status.set_finished()
+            return status
+        if self.prefer_direct and value in self.reachable:
+            hops = [value]
+        else:
+            hops = self.route(value) or [value]
+        logger.info(f"{self.name}: {self.state} -> {' -> '.join(hops)}")
+
+        def run():
+            try:
+                for hop in hops:
+                    self.governor.set(hop).wait(timeout=self.hop_timeout)
+            except Exception as exc:
+                status.set_exception(exc)
+            else:
+                status.set_finished()
+
+        threading.Thread(target=run, daemon=True,
+                         name=f"{self.name} route").start()
+        return status
+
+
+gov_rbt_client = GovernorClient(gov_rbt, name="gov_rbt_client")
+
+
+def bench_governor_route(n_moves=20, unit=0.05, seed=0):
+    """Time random governor moves on a SimGovernor whose transitions take
+    different times (in units of `unit` s): hand-sequenced through SE, as
+    the plans recover now, against GovernorClient moves learned from a
+    first tour of all states, taking direct transitions where they exist
+    (the default) or always the fastest route."""
+    from sim_devices import SimGovernor
+
+    transitions = {
+        "SE": {"TA": 2, "SA": 6, "PA": 4, "BL": 5},
+        "TA": {"SA": 2, "SE": 3},
+        "SA": {"SE": 3, "TA": 2, "PA": 3},
+        "PA": {"SE": 4, "SA": 3},
+        "BL": {"SE": 5},
+    }
+    governor = SimGovernor(name="sim_gov")
+    governor.transitions = {s: {t: d * unit for t, d in targets.items()}
+                            for s, targets in transitions.items()}
+    governor._arrived("SE")
+    client = GovernorClient(governor, path=os.devnull)
+    client.save = lambda: None
+    # learn the graph: visit every state and take every transition once
+    for source, targets in transitions.items():
+        for target in targets:
+            client.set(source).wait(timeout=10)
+            governor.set(target).wait(timeout=10)
+
+    rng = np.random.default_rng(seed)
+    targets = list(transitions)
+    moves = [targets[i] for i in rng.integers(len(targets), size=n_moves)]
+    results = {}
+    for key in ("via SE", "direct", "routed"):
+        client.prefer_direct = key == "direct"
+        client.set("SE").wait(timeout=10)
+        t0 = ttime.perf_counter()
+        for target in moves:
+            if key != "via SE":
+                client.set(target).wait(timeout=10)
+            elif governor.state.get() != target:
+                if target not in governor.reachable.get():
+                    governor.set("SE").wait(timeout=10)
+                if governor.state.get() != target:
+                    governor.set(target).wait(timeout=10)
+        results[key] = ttime.perf_counter() - t0
+        print(f"{key:>7}: {n_moves} moves in {results[key]:.2f} s, "
+              f"{results[key] / n_moves * 1000:.0f} ms/move")
+    return results
@@ -0,0 +1,132 @@
+print(f"Loading {__file__}")
+
+import threading
+
+from ophyd.status import DeviceStatus
+
+
+class SampleExchange:
+    """Sample exchange with the robot preparation overlapped with work on
+    the mounted sample.
+
+    prepare() runs, in the background, the robot steps that don't touch the
+    goniometer: Initialize and gripper CoolDown (Robot.pre_unmount), and
+    optionally opening the dewar port lid. It is started at the end of each
+    exchange, so it runs while the new sample is aligned or measured.
+    exchange() waits for it, moves the governor to `exchange_state` and only
+    then runs the steps that need the goniometer: Unmount/Unload of the
+    current sample, LatchRobGov and TraceSample (pre_mount without its
+    Initialize and CoolDown) and the mount.
+
+    exchange_serial() is the sequence without overlap, as run so far:
+    pre_unmount, unmount, pre_mount, mount. Timeouts in ms as in Robot.
+    """
+
+    def __init__(self, robot, governor, exchange_state="SE", timeout=-1):
+        self.robot = robot
+        self.governor = governor
+        self.exchange_state = exchange_state
+        self.timeout = timeout
+        # sample on the goniometer, None if empty
+        self.mounted = None
+        self._prepared = None
+
+    def prepare(self, open_lid=False):
+        """Start the goniometer-free robot steps; returns their status."""
+        if self._prepared is not None and not self._prepared.done:
+            return self._prepared
+        status = DeviceStatus(self.robot)
+
+        def run():
+            try:
+                self.robot.pre_unmount(timeout=self.timeout)
+                if open_lid:
+                    self.robot.openPort(1, timeout=self.timeout)
+            except Exception as exc:
+                status.set_exception(exc)
+            else:
+                status.set_finished()
+
+        threading.Thread(target=run, daemon=True,
+                         name="robot prepare").start()
+        self._prepared = status
+        return status
+
+    def exchange(self, nSample=None, prepare_next=True):
+        """Replace the mounted sample by `nSample` (None only unmounts);
+        with prepare_next, the preparation for the next exchange starts as
+        soon as the mount is done."""
+        prepared = self._prepared or self.prepare()
+        self._prepared = None
+        prepared.wait()
+        self.governor.set(self.exchange_state).wait()
+        if self.mounted is not None:
+            self.robot.unmount(self.mounted, timeout=self.timeout)
+            self.mounted = None
+        if nSample is not None:
+            self.robot.pre_mount(nSample, init=False, cooldown=False,
+                                 timeout=self.timeout)
+            self.robot.mount(nSample, timeout=self.timeout)
+            self.mounted = nSample
+            if prepare_next:
+                self.prepare()
+
+    def exchange_serial(self, nSample=None):
+        """exchange() without overlapping the preparation."""
+        self.robot.pre_unmount(timeout=self.timeout)
+        self.governor.set(self.exchange_state).wait()
+        if self.mounted is not None:
+            self.robot.unmount(self.mounted, timeout=self.timeout)
+            self.mounted = None
+        if nSample is not None:
+            self.robot.pre_mount(nSample, timeout=self.timeout)
+            self.robot.mount(nSample, timeout=self.timeout)
+            self.mounted = nSample
+
+
+sample_exchange = SampleExchange(robrob, gov_rbt)
+
+
+def bench_sample_exchange(prefix=sim_robot_prefix, n_samples=5,
+                          work_time=2.0, task_time=0.05, gov_time=0.2,
+                          work_state="SA"):
+    """Samples per hour exchanging and working on `n_samples` samples with
+    exchange_serial against the pipelined exchange, on the simulated robot
+    (sim/embl_robot_ioc.py) and a SimGovernor.
+
+    Each sample is worked on (aligned, measured) for `work_time` seconds in
+    governor state `work_state`; robot commands take their TASK_TIMES in
+    units of `task_time` s. Refuses to run unless `prefix` serves the
+    simulator's SIM: PVs.
+    """
+    from sim_devices import SimGovernor
+
+    sim_task_time = EpicsSignal(prefix + "SIM:TaskTime", name="sim_task_time")
+    try:
+        sim_task_time.wait_for_connection(timeout=2)
+    except TimeoutError:
+        raise RuntimeError(f"{prefix} is not a simulated robot") from None
+    sim_task_time.put(task_time, wait=True)
+    robot = Robot(prefix, name="sim_robot")
+    for sig in (robot.task, robot.state, robot.running, robot.task_info,
+                robot.set_variable, robot.get_variable):
+        sig.wait_for_connection(timeout=5)
+    governor = SimGovernor(name="sim_gov")
+    governor.transition_time = gov_time
+
+    results = {}
+    for key in ("serial", "pipelined"):
+        pipeline = SampleExchange(robot, governor, timeout=100000)
+        exchange = (pipeline.exchange_serial if key == "serial"
+                    else pipeline.exchange)
+        t0 = ttime.perf_counter()
+        for k in range(n_samples):
+            exchange(k % 48 + 1)
+            governor.set(work_state).wait()
+            ttime.sleep(work_time)
+        exchange(None)
+        elapsed = ttime.perf_counter() - t0
+        results[key] = n_samples / elapsed * 3600
+        print(f"{key:>9}: {n_samples} samples in {elapsed:.2f} s, "
+              f"{results[key]:.0f} samples/h")
+    return results
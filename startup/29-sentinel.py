@@ -5,38 +5,230 @@ Created on Thu Oct 17 15:43:19 2024
 
 @author: xf17id1
 """
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class HomingError(RuntimeError):
+    pass
+
+
+def _pin_motor(axis, field):
+    return Cpt(EpicsSignalRO, f"XF:17IDB-ES:AMX{{Gon:1-Ax:{axis}}}Mtr.{field}",
+               auto_monitor=True)
 
 
 class PYZHomer(Device):
+    """Sentinel homing of the pin PY/PZ motors.
+
+    kill_pins() kills both motors and confirms it on their motor record
+    monitors (done, closed loop off). trigger() starts the homing and fails
+    early with HomingError, carrying the motors' state, when a motor
+    raises its problem or slip/stall flag or, if `stall_time` is given, the
+    pins have not moved for that many seconds. The stall check is off by
+    default: homing pauses between its stages, and no limit has been checked
+    against a real homing trace yet. The last `history_size` kills and
+    homings are kept in `history`; homing_stats() summarises the durations.
+    """
 
     status = Cpt(EpicsSignalRO, "XF:17IDB-ES:AMX{Sentinel}Homing_Sts")
     home_actuate = Cpt(EpicsSignal, "XF:17ID:AMX{Sentinel}pin_home")
 
     kill_home = Cpt(EpicsSignal, "XF:17IDB-ES:AMX{Sentinel}Homing_Kill")
     kill_py = Cpt(EpicsSignal, "XF:17IDB-ES:AMX{Gon:1-Ax:PY}Cmd:Kill-Cmd")
-    kill_pz = Cpt(EpicsSignal, "XF:17IDB-ES:AMX{Gon:1-Ax:PY}Cmd:Kill-Cmd")
+    kill_pz = Cpt(EpicsSignal, "XF:17IDB-ES:AMX{Gon:1-Ax:PZ}Cmd:Kill-Cmd")
+
+    py_done = _pin_motor("PY", "DMOV")
+    py_msta = _pin_motor("PY", "MSTA")
+    py_rbv = _pin_motor("PY", "RBV")
+    pz_done = _pin_motor("PZ", "DMOV")
+    pz_msta = _pin_motor("PZ", "MSTA")
+    pz_rbv = _pin_motor("PZ", "RBV")
+
+    # motor record MSTA bits
+    msta_closed_loop = 1 << 5
+    msta_slip_stall = 1 << 6
+    msta_problem = 1 << 9
 
-    def __init__(self, *args, **kwargs):
+    timeout = 180
+
+    def __init__(self, *args, stall_time=None, history_size=1000, **kwargs):
         super().__init__(*args, **kwargs)
+        self.stall_time = stall_time
+        self.history = deque(maxlen=history_size)
+
+    def _axes(self):
+        return {"py": (self.kill_py, self.py_done, self.py_msta, self.py_rbv),
+                "pz": (self.kill_pz, self.pz_done, self.pz_msta, self.pz_rbv)}
+
+    def diagnostics(self):
+        """Homing status and, per pin motor, position, done and MSTA flags."""
+        parts = [f"homing status {self.status.get()}"]
+        for axis, (_, done, msta, rbv) in self._axes().items():
+            flags = int(msta.get())
+            parts.append(
+                f"{axis} at {rbv.get():.1f} done={done.get()} "
+                f"closed_loop={bool(flags & self.msta_closed_loop)} "
+                f"slip_stall={bool(flags & self.msta_slip_stall)} "
+                f"problem={bool(flags & self.msta_problem)}")
+        return "; ".join(parts)
+
+    def _record(self, action, start, status):
+        exc = status.exception()
+        self.history.append({"action": action, "start": start,
+                             "duration": ttime.time() - start,
+                             "error": "" if exc is None else str(exc)})
+
+    def kill_pins(self, timeout=5):
+        """Kill PY and PZ; the status finishes once both motors report done
+        with the closed loop off, and fails with HomingError after
+        `timeout` seconds.
+
+        Only monitor updates arriving after the subscription, made before
+        the kill puts, count, so the cached pre-kill state cannot finish
+        the status. A motor that was killed already sends no update: at
+        `timeout` the motor records are read once more and the status
+        finishes if both motors are killed."""
+        status = DeviceStatus(self)
+        start = ttime.time()
+        axes = self._axes()
+        killed = set()
+        finished = []
+        lock = threading.Lock()
+
+        def is_killed(done, msta, **kwargs):
+            return done.get(**kwargs) == 1 and not (
+                int(msta.get(**kwargs)) & self.msta_closed_loop)
+
+        def finish(exc=None):
+            with lock:
+                if finished:
+                    return
+                finished.append(True)
+            if exc is None:
+                status.set_finished()
+            else:
+                status.set_exception(exc)
+
+        def update(value, obj, **kwargs):
+            for axis, (_, done, msta, _) in axes.items():
+                if obj in (done, msta) and is_killed(done, msta):
+                    killed.add(axis)
+            if len(killed) == len(axes):
+                finish()
+
+        def expire():
+            if finished:
+                return
+            try:
+                if all(is_killed(done, msta, use_monitor=False)
+                       for _, done, msta, _ in axes.values()):
+                    finish()
+                    return
+            except Exception as exc:
+                logger.warning(f"Pin motor state not read: {exc}")
+            finish(HomingError(
+                f"Pin motors not killed after {timeout} s: "
+                f"{self.diagnostics()}"))
+
+        subs = [(sig, sig.subscribe(update, run=False))
+                for _, done, msta, _ in axes.values() for sig in (done, msta)]
+        for kill, *_ in axes.values():
+            kill.put(1)
+        timer = threading.Timer(timeout, expire)
+        timer.daemon = True
+        timer.start()
+
+        def clear(status):
+            timer.cancel()
+            for sig, cid in subs:
+                sig.unsubscribe(cid)
+            self._record("kill", start, status)
+
+        status.add_callback(clear)
+        return status
 
     def trigger(self):
+        status = DeviceStatus(self)
+        start = ttime.time()
+        last_move = [ttime.monotonic()]
+        finished = []
+
+        def finish(exc=None):
+            if finished:
+                return
+            finished.append(True)
+            if exc is None:
+                status.set_finished()
+            else:
+                status.set_exception(exc)
 
         def callback_homed(value, old_value, **kwargs):
             if old_value == 1 and value == 0:
-                return True
-            else:
-                return False
+                finish()
 
-        self.home_actuate.put(1)
+        def flags(value, old_value, obj, **kwargs):
+            # flags already raised before homing (e.g. by the kill) are
+            # not a failure, only new ones
+            bad = self.msta_problem | self.msta_slip_stall
+            if old_value is not None and int(value) & bad & ~int(old_value):
+                finish(HomingError(
+                    f"{obj.name} raised a motor fault during homing: "
+                    f"{self.diagnostics()}"))
+
+        def moved(**kwargs):
+            last_move[0] = ttime.monotonic()
+
+        def watchdog():
+            while not finished:
+                if ttime.time() - start > self.timeout:
+                    finish(HomingError(
+                        f"Homing not done after {self.timeout} s: "
+                        f"{self.diagnostics()}"))
+                elif (self.stall_time is not None and ttime.monotonic()
+                      - last_move[0] > self.stall_time):
+                    finish(HomingError(
+                        f"Pins stalled for {self.stall_time} s during "
+                        f"homing: {self.diagnostics()}"))
+                ttime.sleep(0.5)
 
-        homing_status = SubscriptionStatus(
-            self.status,
-            callback_homed,
-            run=False,
-            timeout=180,
-        )
+        subs = [(self.status, self.status.subscribe(callback_homed,
+                                                    run=False))]
+        for _, _, msta, rbv in self._axes().values():
+            subs.append((msta, msta.subscribe(flags, run=False)))
+            subs.append((rbv, rbv.subscribe(moved, run=False)))
+
+        def clear(status):
+            for sig, cid in subs:
+                sig.unsubscribe(cid)
+            self._record("home", start, status)
+
+        status.add_callback(clear)
+        self.home_actuate.put(1)
+        threading.Thread(target=watchdog, daemon=True,
+                         name="pin homing watchdog").start()
+        return status
 
-        return homing_status
+    def homing_stats(self, percentiles=(50, 90, 99)):
+        """Count, failures and duration percentiles (s) of the recorded
+        kills and homings."""
+        columns = ["count", "failed"] + [f"p{p:g}" for p in percentiles]
+        if not self.history:
+            return pd.DataFrame(columns=columns,
+                                index=pd.Index([], name="action"))
+        history = pd.DataFrame(list(self.history),
+                               columns=["action", "start", "duration",
+                                        "error"])
+        groups = history.groupby("action")
+        stats = groups["duration"].quantile(
+            [p / 100 for p in percentiles]).unstack()
+        stats.columns = [f"p{p:g}" for p in percentiles]
+        stats.insert(0, "count", groups.size())
+        stats.insert(1, "failed", groups["error"].agg(
+            lambda s: (s != "").sum()))
+        return stats
 
 
 goniomon = EpicsSignal("XF:17ID:AMX{Karen}goniomon", name="goniomon")
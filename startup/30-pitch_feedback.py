@@ -0,0 +1,318 @@
+print(f"Loading {__file__}")
+
+import threading
+from collections import deque
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class PitchFeedback:
+    """Software PID loop holding the DCM pitch on a monitored beam signal
+
+    An optional alternative to the IOC pitch hold (vdcm_hold_pitch). The beam
+    signal (bpm3.y by default, or e.g. keithley.current on the flank of the
+    rocking curve) is read through a CA monitor, so the loop itself does no
+    gets. Every `period` seconds one correction is computed and sent to the
+    pitch motor without waiting:
+
+        delta = -(kp * e + ki * integral(e) + kd * de/dt) / slope
+
+    with e = signal - setpoint and `slope` the local d(signal)/d(pitch) in
+    signal units per mrad (see `calibrate_slope`). Each correction is clipped
+    to `max_step` and the pitch is never moved further than `window` from
+    where it was when the loop was started.
+
+    The loop holds (and resets its integrator) whenever one of the
+    `pause_sources` reports busy, e.g. the governor is moving between states
+    or a Zebra is armed for a fly scan, and waits `resume_delay` seconds after
+    the last one clears before correcting again. Pauses arrive on CA callback
+    threads; the loop state is guarded by a lock, so a pause either comes
+    before a correction (which is then skipped) or after its move was sent.
+
+    Parameters
+    ----------
+    signal : ophyd Signal
+        Monitored beam signal.
+    motor : ophyd positioner
+        Pitch motor, vdcm.p.
+    slope : float
+        d(signal)/d(pitch) at the working point, signal units per mrad.
+    setpoint : float
+        Signal value to hold. If None, the value at start() is used.
+    pause_sources : list of (signal, predicate, reason)
+        The loop is held while predicate(value) is True for any signal.
+    """
+
+    def __init__(self, signal, motor, *, slope=None, setpoint=None,
+                 kp=0.5, ki=0.1, kd=0.0, period=1.0, deadband=0.0,
+                 max_step=0.0005, window=0.005, resume_delay=2.0,
+                 pause_sources=None, history=1000, clock=ttime.time):
+        self.signal = signal
+        self.motor = motor
+        self.slope = slope
+        self.setpoint = setpoint
+        self.kp, self.ki, self.kd = kp, ki, kd
+        self.period = period
+        self.deadband = deadband
+        self.max_step = max_step
+        self.window = window
+        self.resume_delay = resume_delay
+        self.pause_sources = list(pause_sources or [])
+        self.history = deque(maxlen=history)
+
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._value = None
+        self._reference = None
+        self._paused_by = set()
+        self._hold_until = 0
+        self._at_edge = False
+        self._subs = []
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._reset()
+
+    def _reset(self):
+        with self._lock:
+            self._integral = 0.0
+            self._last_error = None
+            self._last_time = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def paused(self):
+        return bool(self._paused_by)
+
+    def _signal_cb(self, value, **kwargs):
+        self._value = value
+
+    def _make_pause_cb(self, predicate, reason):
+        def pause_cb(value, **kwargs):
+            if predicate(value):
+                self.pause(reason)
+            else:
+                self.resume(reason)
+        return pause_cb
+
+    def pause(self, reason="user"):
+        with self._lock:
+            if reason not in self._paused_by:
+                logger.info(f"Pitch feedback paused: {reason}")
+            self._paused_by.add(reason)
+            self._reset()
+
+    def resume(self, reason="user"):
+        with self._lock:
+            if reason in self._paused_by:
+                self._paused_by.discard(reason)
+                logger.info(f"Pitch feedback resumed: {reason}")
+                if not self._paused_by:
+                    self._hold_until = self._clock() + self.resume_delay
+
+    def _subscribe(self):
+        self._subs.append(
+            (self.signal, self.signal.subscribe(self._signal_cb, run=True)))
+        for sig, predicate, reason in self.pause_sources:
+            cb = self._make_pause_cb(predicate, reason)
+            self._subs.append((sig, sig.subscribe(cb, run=True)))
+
+    def _unsubscribe(self):
+        for sig, cid in self._subs:
+            sig.unsubscribe(cid)
+        self._subs.clear()
+
+    def attach(self):
+        """Subscribe to the beam and pause signals and latch the reference
+        pitch and setpoint, without starting the loop thread."""
+        if self.slope is None or self.slope == 0:
+            raise ValueError(
+                "slope must be set (use calibrate_slope) before starting")
+        self._subscribe()
+        self._reference = self.motor.position
+        if self.setpoint is None:
+            self.setpoint = self._value
+        self._at_edge = False
+        self._reset()
+
+    def detach(self):
+        self._unsubscribe()
+        with self._lock:
+            self._paused_by.clear()
+
+    def start(self):
+        """Start the feedback loop in a background thread."""
+        if self.running:
+            return
+        if vdcm_hold_pitch.get():
+            raise RuntimeError(
+                "IOC pitch hold (vdcm_hold_pitch) is active, disable it "
+                "before starting the software feedback")
+        self.attach()
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="pitch_feedback", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Pitch feedback started: setpoint {self.setpoint:.5g}, "
+            f"reference pitch {self._reference:.5f}")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2 * self.period)
+        self._thread = None
+        self.detach()
+        logger.info("Pitch feedback stopped")
+
+    def _run(self):
+        while not self._stop_event.wait(self.period):
+            try:
+                self.step()
+            except Exception:
+                logger.exception("Pitch feedback step failed")
+
+    def step(self):
+        """Compute and apply one correction, return the pitch move (mrad)."""
+        with self._lock:
+            return self._step()
+
+    def _step(self):
+        now = self._clock()
+        if self.paused or self._value is None or now < self._hold_until:
+            return 0.0
+
+        error = float(self._value) - self.setpoint
+        if abs(error) <= self.deadband:
+            self._last_error, self._last_time = error, now
+            return 0.0
+
+        dt = self.period if self._last_time is None else now - self._last_time
+        self._integral += error * dt
+        deriv = (0.0 if self._last_error is None or dt <= 0
+                 else (error - self._last_error) / dt)
+        self._last_error, self._last_time = error, now
+
+        u = self.kp * error + self.ki * self._integral + self.kd * deriv
+        delta = np.clip(-u / self.slope, -self.max_step, self.max_step)
+
+        current = self.motor.position
+        target = np.clip(current + delta, self._reference - self.window,
+                         self._reference + self.window)
+        delta = target - current
+        at_edge = target in (self._reference - self.window,
+                             self._reference + self.window)
+        if at_edge:
+            # anti-windup, do not keep integrating against the window edge
+            self._integral -= error * dt
+            if not self._at_edge:
+                logger.warning(
+                    f"Pitch feedback at window edge ({target:.5f}), "
+                    "a rocking curve may be needed")
+        self._at_edge = at_edge
+        if delta == 0:
+            return 0.0
+
+        self.motor.set(target)
+        self.history.append((now, float(self._value), error, current, delta))
+        logger.info(
+            f"Pitch feedback: {self.signal.name}={self._value:.5g} "
+            f"error={error:.4g} pitch {current:.5f} -> {target:.5f}")
+        return delta
+
+    def calibrate_slope(self, delta=0.002, settle_time=1.0):
+        """Measure d(signal)/d(pitch) by stepping the pitch by +/- delta.
+
+        Blocking, run outside the RunEngine with the loop stopped."""
+        start = self.motor.position
+        readings = []
+        try:
+            for offset in (-delta, delta):
+                self.motor.set(start + offset).wait()
+                ttime.sleep(settle_time)
+                readings.append(self.signal.get())
+        finally:
+            self.motor.set(start).wait()
+        self.slope = (readings[1] - readings[0]) / (2 * delta)
+        logger.info(f"Pitch feedback slope: {self.slope:.5g} per mrad")
+        return self.slope
+
+
+pitch_feedback = PitchFeedback(
+    bpm3.y,
+    vdcm.p,
+    pause_sources=[
+        (gov_rbt.state, lambda value: value == 'M', 'governor transition'),
+        (zebra1.pos_capt.arm.output, lambda value: int(value) == 1,
+         'zebra1 armed'),
+        (zebra2.pos_capt.arm.output, lambda value: int(value) == 1,
+         'zebra2 armed'),
+        (pb_vector.running, lambda value: int(value) == 1,
+         'vector collection'),
+    ],
+)
+
+
+def test_pitch_feedback(n_steps=1800, period=1.0, slope=-5000.0,
+                        drift=2e-6, noise=0.2, pause=(600, 660), **kwargs):
+    """Run the pitch feedback against a simulated beam-vs-pitch model.
+
+    The beam position follows slope * (pitch - p0(t)) + noise, where the
+    optimal pitch p0 drifts by `drift` mrad per step. The loop runs on a
+    simulated clock; between the `pause` steps a governor transition is
+    simulated and the loop must hold. Every write to the simulated pitch
+    setpoint is recorded with its step. Returns rms beam errors without and
+    with feedback, the number of corrections and the setpoint writes made
+    during the pause window (must be zero).
+    """
+    from ophyd.sim import SynAxis
+
+    rng = np.random.default_rng(0)
+    p0 = 6.3245
+    clock = [0.0]
+
+    results = {}
+    for enabled in (False, True):
+        motor = SynAxis(name="sim_pitch", value=p0)
+        beam = Signal(name="sim_beam_y", value=0.0)
+        gov_state = Signal(name="sim_gov_state", value="SA")
+        fb = PitchFeedback(
+            beam, motor, slope=slope, setpoint=0.0, period=period,
+            pause_sources=[(gov_state, lambda value: value == 'M',
+                            'governor transition')],
+            clock=lambda: clock[0], **kwargs)
+        fb.attach()
+
+        step = [0]
+        writes = []
+        motor.setpoint.subscribe(
+            lambda value, **kwargs: writes.append((step[0], value)),
+            run=False)
+
+        errors = []
+        for k in range(n_steps):
+            step[0] = k
+            clock[0] = k * period
+            gov_state.put('M' if pause[0] <= k < pause[1] else 'SA')
+            beam.put(slope * (motor.position - (p0 + drift * k))
+                     + noise * rng.standard_normal())
+            errors.append(beam.get())
+            if enabled:
+                fb.step()
+        fb.detach()
+        paused_moves = sum(pause[0] <= k < pause[1] for k, _ in writes)
+
+        key = "closed_loop" if enabled else "open_loop"
+        results[f"{key}_rms"] = float(np.sqrt(np.mean(np.square(errors))))
+        if enabled:
+            results["corrections"] = len(fb.history)
+            results["paused_moves"] = paused_moves
+
+    print(f"rms beam error open loop: {results['open_loop_rms']:.3g}, "
+          f"closed loop: {results['closed_loop_rms']:.3g} "
+          f"({results['corrections']} corrections, "
+          f"{results['paused_moves']} setpoint writes while paused)")
+    return results
@@ -29,6 +29,69 @@ def simple_ascan(camera, stats, motor, start, end, steps):
     yield from inner()
 
 
+class MirrorScanFlyer(Device):
+    """mirror_scan's flyer: the stats plugin centroid time series against
+    the position captured by `zebra` on encoder `encoder_idx` (0-based),
+    as event pages of the rows not collected yet."""
+
+    def __init__(self, *args, zebra, stats, encoder_idx, **kwargs):
+        self._last_point = 0
+        self._zebra = zebra
+        self._encoder_idx = encoder_idx
+
+        self._ts = zebra.pos_capt.data.time
+        self._centroid_x = stats.ts_centroid.x
+        self._centroid_y = stats.ts_centroid.y
+        self._enc = getattr(zebra.pos_capt.data, f'enc{encoder_idx+1}')
+
+        self._data_sources = (
+            self._centroid_x, self._centroid_y, self._enc)
+
+        super().__init__(*args, **kwargs)
+
+    def kickoff(self):
+        return self._zebra.kickoff()
+
+    def complete(self):
+        return self._zebra.complete()
+
+    def collect_pages(self):
+        data = {
+            sig: np.asarray(sig.get(use_monitor=False))
+            for sig in self._data_sources
+        }
+        data[self._enc] = self._zebra.encoder_positions(
+            self._encoder_idx + 1, data[self._enc])
+
+        timestamps = self._zebra.wall_times(self._ts.get(use_monitor=False))
+
+        min_len = min([len(d) for d in data.values()])
+        if min_len > self._last_point:
+            points = slice(self._last_point, min_len)
+            yield {
+                'data': {sig.name: data[sig][points] for sig in data},
+                'timestamps': {sig.name: timestamps[points]
+                               for sig in data},
+            }
+
+        self._last_point = min_len
+
+    if not bluesky_collect_pages:
+        def collect(self):
+            yield from events_from_pages(self.collect_pages())
+
+    def describe_collect(self):
+        return {
+            'primary': {
+                sig.name: {
+                    'source': 'PV:' + sig.pvname,
+                    'shape': [],
+                    'dtype': 'number'
+                } for sig in self._data_sources
+            }
+        }
+
+
 def mirror_scan(mir, start, end, steps, gap=None, speed=None, camera=None):
     """Scans a slit aperture center over a mirror against a camera
 
@@ -141,59 +204,8 @@ def mirror_scan(mir, start, end, steps, gap=None, speed=None, camera=None):
         collect=encoders
     )
 
-    class CustomFlyer(Device):
-        def __init__(self, *args, **kwargs):
-            self._last_point = 0
-            self._collection_ts = None
-
-            self._ts = zebra.pos_capt.data.time
-            self._centroid_x = stats.ts_centroid.x
-            self._centroid_y = stats.ts_centroid.y
-            self._enc = getattr(zebra.pos_capt.data, f'enc{encoder_idx+1}')
-
-            self._data_sources = (
-                self._centroid_x, self._centroid_y, self._enc)
-
-            super().__init__(*args, **kwargs)
-
-        def kickoff(self):
-            self._collection_ts = time.time()
-            return zebra.kickoff()
-
-        def complete(self):
-            return zebra.complete()
-
-        def collect(self):
-            data = {
-                sig: sig.get(use_monitor=False) for sig in self._data_sources
-            }
-
-            timestamps = self._ts.get(use_monitor=False) + self._collection_ts
-
-            min_len = min([len(d) for d in data.values()])
-            cur_time = time.time()
-
-            for i in range(self._last_point, min_len):
-                yield {
-                    'data': {sig.name: data[sig][i] for sig in data},
-                    'timestamps': {sig.name: timestamps[i] for sig in data},
-                    'time': cur_time
-                }
-
-            self._last_point = min_len
-
-        def describe_collect(self):
-            return {
-                'primary': {
-                    sig.name: {
-                        'source': 'PV:' + sig.pvname,
-                        'shape': [],
-                        'dtype': 'number'
-                    } for sig in self._data_sources
-                }
-            }
-
-    flyer = CustomFlyer('', name='flyer')
+    flyer = MirrorScanFlyer('', name='flyer', zebra=zebra, stats=stats,
+                            encoder_idx=encoder_idx)
 
     # Setup plot
     y1 = stats.ts_centroid.x.name
@@ -251,18 +263,83 @@ def mirror_scan(mir, start, end, steps, gap=None, speed=None, camera=None):
         yield from bps.abs_set(slt_ctr, end + move_slack)
 
         while not st.done:
-            yield from bps.collect(flyer, stream=True)
+            yield from collect_paged(flyer)
             # RE._uncollected.add(flyer)        # TODO: This is a hideous hack until the next bluesky version. Remove this line
             yield from bps.sleep(0.5)
 
         yield from bps.sleep(1)
-        yield from bps.collect(flyer, stream=True)
+        yield from collect_paged(flyer)
 
         yield from bps.mv(stats.ts_control, "Stop")
 
     yield from inner()
 
 
+def test_mirror_scan_flyer(n_points=1000, n_updates=5, period=0.2):
+    """Run mirror_scan's flyer through a RunEngine on a simulated Zebra and
+    stats plugin, collecting during the scan as mirror_scan does, and check
+    that every point comes out once, in event pages."""
+    from bluesky import RunEngine
+    from sim_devices import SimCASignal, make_sim_device
+
+    class SimCentroid(Device):
+        x = Cpt(SimCASignal, value=[])
+        y = Cpt(SimCASignal, value=[])
+
+    class SimStats(Device):
+        ts_centroid = Cpt(SimCentroid, '')
+
+    zebra = make_sim_device(Zebra)('SIM:', name='sim_zebra')
+    stats = SimStats('', name='sim_stats')
+    flyer = MirrorScanFlyer('', name='flyer', zebra=zebra, stats=stats,
+                            encoder_idx=2)
+    pc = zebra.pos_capt
+    pc.arm.output.put(0)
+    zebra.download_status.put(1)
+    pc.data.time.put(np.empty(0))
+    pc.data.enc3.put(np.empty(0))
+    positions = np.linspace(-50, 50, n_points)
+
+    def ioc():
+        pc.arm.output.put(1)
+        for k in range(1, n_updates + 1):
+            time.sleep(period)
+            n = n_points * k // n_updates
+            pc.data.time.put(np.arange(n) * 1.0)
+            pc.data.enc3.put(positions[:n])
+            stats.ts_centroid.x.put(positions[:n] * 2)
+            stats.ts_centroid.y.put(positions[:n] * 3)
+        pc.arm.output.put(0)
+        zebra.download_status.put(0)
+
+    pc.arm.arm.subscribe(lambda value, **kwargs: value and threading.Thread(
+        target=ioc, daemon=True).start(), run=False)
+
+    @bpp.run_decorator()
+    def plan():
+        yield from bps.kickoff(flyer, wait=True)
+        st = yield from bps.complete(flyer)
+        while not st.done:
+            yield from collect_paged(flyer)
+            yield from bps.sleep(period / 2)
+        yield from collect_paged(flyer)
+
+    docs = Counter()
+    rows = []
+
+    def count(name, doc):
+        docs[name] += 1
+        if name == 'event_page':
+            rows.extend(doc['data'][pc.data.enc3.name])
+
+    RunEngine({})(plan(), count)
+    assert docs['event'] == 0
+    assert docs['event_page'] > 1
+    assert np.allclose(rows, positions)
+    print(f"{len(rows)} points in {docs['event_page']} event pages")
+    return docs
+
+
 def focus_scan(steps, step_size=2, speed=None, cam=cam_6, filename='test', folder='/tmp/', use_roi4=False):
     """ Scans a sample along Z against a camera, taking pictures in the process.
 
@@ -0,0 +1,308 @@
+print(f"Loading {__file__}")
+
+import threading
+import bluesky.preprocessors as bpp
+import bluesky.plan_stubs as bps
+
+# K absorption edges (eV)
+absorption_edges = {
+    'Mn': 6539, 'Fe': 7112, 'Co': 7709, 'Ni': 8333, 'Cu': 8979,
+    'Zn': 9659, 'Ga': 10367, 'As': 11867, 'Se': 12658, 'Br': 13474,
+    'Kr': 14326, 'Sr': 16105,
+}
+
+
+class MercuryEnergyFlyer(Device):
+    """Slice Mercury live-time acquisitions while the DCM energy moves.
+
+    kickoff() starts a worker that repeatedly erases/starts the Mercury with a
+    short preset live time. Each slice is timestamped at start and at the end
+    of acquisition and placed on the energy axis by interpolating the
+    monitored vdcm.e readback, so the energy motion itself is never waited on.
+    """
+
+    def __init__(self, *args, det=None, energy=None, slice_time=0.1,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self._det = det or mercury
+        self._energy = energy or vdcm.e
+        self.slice_time = slice_time
+        self._stop_event = threading.Event()
+        self._acq_done = threading.Event()
+        self._thread = None
+        self._complete_status = None
+        self._energy_trace = []
+        self._slices = []
+        self._last_point = 0
+        self._subs = []
+
+    def _energy_cb(self, value, timestamp, **kwargs):
+        self._energy_trace.append((timestamp, value))
+
+    def _acquiring_cb(self, value, old_value, **kwargs):
+        if old_value == 1 and value == 0:
+            self._acq_done.set()
+
+    def _roi_counts(self):
+        return tuple(getattr(self._det.mca.rois, f'roi{k}').count.get()
+                     for k in range(4))
+
+    def _acquire_slices(self):
+        det = self._det
+        try:
+            while not self._stop_event.is_set():
+                self._acq_done.clear()
+                t_start = ttime.time()
+                det.erase_start.put(1)
+                if not self._acq_done.wait(10 * self.slice_time + 5):
+                    raise TimeoutError("Mercury slice did not finish")
+                t_end = ttime.time()
+                self._slices.append(
+                    (t_start, t_end, *self._roi_counts(),
+                     det.mca.elapsed_live_time.get(),
+                     det.mca.elapsed_real_time.get()))
+        except Exception as error:
+            self._complete_status.set_exception(error)
+            return
+        self._complete_status.set_finished()
+
+    def kickoff(self):
+        self._energy_trace.clear()
+        self._slices.clear()
+        self._last_point = 0
+        self._stop_event.clear()
+        self._complete_status = DeviceStatus(self)
+
+        readback = self._energy.user_readback
+        self._subs = [
+            (readback, readback.subscribe(self._energy_cb, run=True)),
+            (self._det.acquiring,
+             self._det.acquiring.subscribe(self._acquiring_cb, run=False)),
+        ]
+
+        self._thread = threading.Thread(
+            target=self._acquire_slices, name="edge_scan_slices", daemon=True)
+        self._thread.start()
+
+        status = DeviceStatus(self)
+        status.set_finished()
+        return status
+
+    def complete(self):
+        """Stop after the current slice, status finishes once it is read."""
+        self._stop_event.set()
+        return self._complete_status
+
+    @property
+    def slices(self):
+        """(n, 8) array: t_start, t_end, roi0-3 counts, live and real time"""
+        return np.asarray(self._slices)
+
+    def _unsubscribe(self):
+        for sig, cid in self._subs:
+            sig.unsubscribe(cid)
+        self._subs = []
+
+    def slice_energies(self, slices):
+        """Interpolate slice start/end/mid energies from the energy monitor."""
+        t_e, e = np.asarray(self._energy_trace).T
+        t_start, t_end = slices[:, 0], slices[:, 1]
+        e_start = np.interp(t_start, t_e, e)
+        e_end = np.interp(t_end, t_e, e)
+        return e_start, e_end, 0.5 * (e_start + e_end)
+
+    def collect_pages(self):
+        """Slices read since the previous call, as one event page."""
+        if self._complete_status is not None and self._complete_status.done:
+            self._unsubscribe()
+        n = len(self._slices)
+        if n == self._last_point or not self._energy_trace:
+            return
+        slices = np.asarray(self._slices[self._last_point:n])
+        e_start, e_end, e_mid = self.slice_energies(slices)
+        data = {
+            f'{self.name}_energy': e_mid,
+            f'{self.name}_energy_start': e_start,
+            f'{self.name}_energy_end': e_end,
+            f'{self.name}_live_time': slices[:, 6],
+            f'{self.name}_real_time': slices[:, 7],
+            **{f'{self.name}_roi{k}': slices[:, 2 + k] for k in range(4)},
+        }
+        yield {
+            'data': data,
+            'timestamps': {k: slices[:, 1] for k in data},
+        }
+        self._last_point = n
+
+    if not bluesky_collect_pages:
+        def collect(self):
+            yield from events_from_pages(self.collect_pages())
+
+    def describe_collect(self):
+        mca = self._det.mca
+        energy = self._energy.user_readback
+        sources = {
+            'energy': energy, 'energy_start': energy, 'energy_end': energy,
+            'live_time': mca.elapsed_live_time,
+            'real_time': mca.elapsed_real_time,
+            **{f'roi{k}': getattr(mca.rois, f'roi{k}').count
+               for k in range(4)},
+        }
+        return {
+            'primary': {
+                f'{self.name}_{k}': {
+                    'source': 'PV:' + sig.pvname,
+                    'shape': [],
+                    'dtype': 'number'
+                } for k, sig in sources.items()
+            }
+        }
+
+
+def reconstruct_mu(energy, counts, live_time, *, grid_step=0.5, i0=None):
+    """Rebin sliced fluorescence counts onto a dense, regular energy grid.
+
+    Each slice contributes counts/live_time (optionally divided by i0) to the
+    grid bin of its mid energy; bins are live-time weighted averages. Empty
+    bins are interpolated from their neighbours.
+
+    Returns
+    -------
+    grid, mu : ndarray
+    """
+    energy = np.asarray(energy, dtype=float)
+    counts = np.asarray(counts, dtype=float)
+    live_time = np.asarray(live_time, dtype=float)
+    if i0 is not None:
+        counts = counts / np.asarray(i0, dtype=float)
+
+    lo = np.floor(energy.min() / grid_step) * grid_step
+    idx = np.floor((energy - lo) / grid_step).astype(np.intp)
+    nbins = idx.max() + 1
+    grid = lo + grid_step * (np.arange(nbins) + 0.5)
+
+    total = np.bincount(idx, weights=counts, minlength=nbins)
+    exposure = np.bincount(idx, weights=live_time, minlength=nbins)
+    filled = exposure > 0
+    mu = np.interp(grid, grid[filled], total[filled] / exposure[filled])
+    return grid, mu
+
+
+def step_scan_overhead(det, motor, positions, live_time):
+    """Plan measuring the per-point overhead (s) of a step scan with `det`
+    along `motor`: move to each of `positions` and acquire `live_time` s
+    there; returns the median time per point minus the live time. Leaves
+    det.preset_live_time at `live_time`. Nothing is read or recorded, so
+    the event emission of a real step scan is not included."""
+    yield from bps.mv(det.preset_live_time, live_time)
+    yield from bps.mv(motor, positions[0])
+    times = []
+    for pos in positions[1:]:
+        t0 = ttime.time()
+        yield from bps.mv(motor, pos)
+        yield from bps.trigger(det, wait=True)
+        times.append(ttime.time() - t0)
+    return float(np.median(times)) - live_time
+
+
+def edge_scan_step_estimate(e_range, step=0.5, live_time=1.0,
+                            overhead=0.6):
+    """Time (s) of the equivalent step scan: the preset live time plus
+    `overhead` s per point for move, settle and erase/read, at `step` eV
+    spacing. Only as good as `overhead`; edge_scan measures it with
+    step_scan_overhead unless it is given."""
+    n_points = int(np.ceil(e_range / step)) + 1
+    return n_points * (live_time + overhead)
+
+
+def edge_scan(element='Se', low=-100, high=150, speed=2.0, slice_time=0.1,
+              grid_step=0.5, roi_index=0, det=None, md=None,
+              step_overhead=None, overhead_points=6):
+    """Continuous-energy fluorescence scan across an absorption edge.
+
+    vdcm.e moves at constant `speed` (eV/s) from edge+low to edge+high while
+    the Mercury accumulates back-to-back `slice_time` live-time slices. The
+    slices are placed on the energy axis from the energy readback monitor and
+    rebinned on a `grid_step` grid with reconstruct_mu.
+
+    Only the Bragg energy moves; the undulator gap stays where it is, so keep
+    the range within the harmonic width.
+
+    Parameters
+    ----------
+    element : str or float
+        Element symbol from absorption_edges, or an edge energy in eV.
+    low, high : float
+        Scan limits relative to the edge (eV).
+    speed : float
+        Energy speed (eV/s).
+    slice_time : float
+        Mercury preset live time per slice (s).
+    step_overhead : float, optional
+        Per-point overhead (s) of a step scan, for the printed comparison
+        with edge_scan_step_estimate. By default it is measured before the
+        fly scan with step_scan_overhead, stepping `overhead_points` points
+        of `grid_step` from the start energy.
+
+    Returns
+    -------
+    grid, mu : ndarray
+        Reconstructed fluorescence trace.
+    """
+    det = det or mercury
+    edge = absorption_edges.get(element, element)
+    start, end = edge + low, edge + high
+
+    flyer = MercuryEnergyFlyer(
+        name='edge_scan', det=det, energy=vdcm.e, slice_time=slice_time)
+    timing = {}
+
+    _md = {'plan_name': 'edge_scan', 'element': element, 'edge': edge,
+           'speed': speed, 'slice_time': slice_time}
+    _md.update(md or {})
+
+    @bpp.reset_positions_decorator([det.preset_mode, det.preset_live_time])
+    @bpp.reset_positions_decorator([vdcm.e.velocity])
+    @bpp.run_decorator(md=_md)
+    def inner():
+        yield from bps.mv(det.preset_mode, 'Live time')
+        if step_overhead is None:
+            timing['overhead'] = yield from step_scan_overhead(
+                det, vdcm.e, start + grid_step * np.arange(overhead_points),
+                slice_time)
+        else:
+            timing['overhead'] = step_overhead
+        yield from bps.mv(
+            det.preset_live_time, slice_time,
+            vdcm.e, start,
+        )
+        yield from bps.mv(vdcm.e.velocity, speed)
+
+        t0 = ttime.time()
+        yield from bps.kickoff(flyer, wait=True)
+        st = yield from bps.abs_set(vdcm.e, end)
+        while not st.done:
+            yield from collect_paged(flyer)
+            yield from bps.sleep(0.5)
+        yield from bps.complete(flyer, wait=True)
+        yield from collect_paged(flyer)
+        timing['elapsed'] = ttime.time() - t0
+
+    yield from inner()
+    elapsed = timing['elapsed']
+
+    slices = flyer.slices
+    _, _, e_mid = flyer.slice_energies(slices)
+    grid, mu = reconstruct_mu(
+        e_mid, slices[:, 2 + roi_index], slices[:, 6], grid_step=grid_step)
+
+    # same live time per energy point as the fly scan accumulates per bin
+    step_time = edge_scan_step_estimate(
+        end - start, step=grid_step, live_time=grid_step / speed,
+        overhead=timing['overhead'])
+    source = "given" if step_overhead is not None else "measured"
+    print(f"edge scan {element}: {len(slices)} slices, {len(grid)} points "
+          f"in {elapsed:.1f} s; step scan ~{step_time:.0f} s "
+          f"({step_time / elapsed:.1f}x) with {timing['overhead']:.2f} s "
+          f"{source} overhead per point")
+    return grid, mu
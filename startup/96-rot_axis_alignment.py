@@ -10,6 +10,15 @@ from ophyd import PseudoPositioner, PseudoSingle, Staged
 print(f"Loading {__file__}")
 
 
+def cam_to_gonio(cam_y, cam_z, omega):
+    """Rotate camera-basis (cam_y, cam_z) into (pinY, pinZ) at omega
+    (degrees), see GonioCameraPositioner. Works on scalars or arrays."""
+    d = np.pi / 180
+    return (
+        cam_y * np.cos(omega * d) - cam_z * np.sin(omega * d),
+        cam_y * np.sin(omega * d) + cam_z * np.cos(omega * d),
+    )
+
 
 class GonioCameraPositioner(PseudoPositioner):
     """move gonio fine stage with camera basis for any omega
@@ -78,16 +87,8 @@ class GonioCameraPositioner(PseudoPositioner):
     @pseudo_position_argument
     def forward(self, pos):
         """pseudo -> real, motor I/O in degrees"""
-        d = np.pi / 180
-        omega = self.omega.get()
-        return self.RealPosition(
-            real_y=(
-                pos.cam_y * np.cos(omega * d) - pos.cam_z * np.sin(omega * d)
-            ),
-            real_z=(
-                pos.cam_y * np.sin(omega * d) + pos.cam_z * np.cos(omega * d)
-            ),
-        )
+        real_y, real_z = cam_to_gonio(pos.cam_y, pos.cam_z, self.omega.get())
+        return self.RealPosition(real_y=real_y, real_z=real_z)
 
     @real_position_argument
     def inverse(self, pos):
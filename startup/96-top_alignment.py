@@ -112,7 +112,7 @@ class TopAlignerBase(Device):
         EpicsMotorSPMG, "XF:17IDB-ES:AMX{Gon:1-Ax:PZ}Mtr", timeout=6
     )
     kill_py = Cpt(EpicsSignal, "XF:17IDB-ES:AMX{Gon:1-Ax:PY}Cmd:Kill-Cmd")
-    kill_pz = Cpt(EpicsSignal, "XF:17IDB-ES:AMX{Gon:1-Ax:PY}Cmd:Kill-Cmd")
+    kill_pz = Cpt(EpicsSignal, "XF:17IDB-ES:AMX{Gon:1-Ax:PZ}Cmd:Kill-Cmd")
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -202,7 +202,7 @@ class TopAlignerFast(TopAlignerBase):
 
     def stage(self, *args, **kwargs):
 
-        if gov_rbt.state.get() == 'M':
+        if gov_rbt_client.state == 'M':
             raise GovernorError("Governor busy or in M during staging attempt")
 
         # Resolve any stage_sigs keys given as strings: 'a.b' -> self.a.b
@@ -210,7 +210,12 @@ class TopAlignerFast(TopAlignerBase):
         for k, v in self.stage_sigs.items():
             if isinstance(k, str):
                 # Device.__getattr__ handles nested attr lookup
-                stage_sigs[getattr(self, k)] = v
+                sig = getattr(self, k)
+                # Zebra fields already at the staged value are not
+                # rewritten (nor restored on unstage)
+                if k.startswith("zebra.") and not self.zebra._differs(sig, v):
+                    continue
+                stage_sigs[sig] = v
             else:
                 stage_sigs[k] = v
 
@@ -265,7 +270,7 @@ class TopAlignerFast(TopAlignerBase):
             run=False,
             settle_time=0.5,
         )
-        self.zebra.pos_capt.arm.arm.set(1)
+        self.zebra.arm()
         callback_armed_status.wait(timeout=6)
         return devices_staged
 
@@ -288,7 +293,7 @@ class TopAlignerFast(TopAlignerBase):
             timeout=6,
         )
 
-        if self.target_gov_state.get() in gov_rbt.reachable.get():
+        if self.target_gov_state.get() in gov_rbt_client.reachable:
             gov_rbt.set(self.target_gov_state.get(), wait=True)
             # self.gonio_o.set(0)
             return callback_unarmed_status
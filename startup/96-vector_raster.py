@@ -0,0 +1,131 @@
+print(f"Loading {__file__}")
+
+import bluesky.preprocessors as bpp
+import bluesky.plan_stubs as bps
+
+
+def raster_segments(width, height, n_cols, n_rows, exposure, *, omega=0.0,
+                    origin=(0.0, 0.0, 0.0), frame="camera", serpentine=True):
+    """PowerBrick vector segments, one per raster row, for a centred grid.
+
+    Rows run along gonio x (the horizontal camera axis); the grid steps
+    `height` vertically. With frame="camera" the vertical step is the
+    camera vertical (cam_y) and is rotated into pinY/pinZ at `omega` with
+    cam_to_gonio, as GonioCameraPositioner does; with frame="gonio" it is
+    pinY. Serpentine ordering reverses every other row so no row starts
+    with a return move.
+
+    Parameters
+    ----------
+    width, height : float
+        Grid size in gonio units (um).
+    n_cols : int
+        Samples per row (num_samples of each vector).
+    n_rows : int
+        Number of rows/segments.
+    exposure : float
+        Exposure per sample, as for pb_vector.exposure.
+    origin : (gx, py, pz)
+        Grid centre in gonio coordinates.
+
+    Returns
+    -------
+    numpy structured array with vector_segment_dtype
+    """
+    gx0, py0, pz0 = origin
+    rows = (np.linspace(-height / 2, height / 2, n_rows) if n_rows > 1
+            else np.zeros(1))
+    x_start = np.full(n_rows, gx0 - width / 2)
+    x_end = np.full(n_rows, gx0 + width / 2)
+    if serpentine:
+        x_start[1::2], x_end[1::2] = x_end[1::2].copy(), x_start[1::2].copy()
+
+    if frame == "camera":
+        dy, dz = cam_to_gonio(rows, 0.0, omega)
+    elif frame == "gonio":
+        dy, dz = rows, np.zeros_like(rows)
+    else:
+        raise ValueError(f"frame must be 'camera' or 'gonio', not {frame!r}")
+
+    segments = np.empty(n_rows, dtype=vector_segment_dtype)
+    segments["x_start"], segments["x_end"] = x_start, x_end
+    segments["y_start"] = segments["y_end"] = py0 + dy
+    segments["z_start"] = segments["z_end"] = pz0 + dz
+    segments["o_start"] = segments["o_end"] = omega
+    segments["exposure"] = exposure
+    segments["num_samples"] = n_cols
+    return vector_program(segments)
+
+
+def raster_scan(width, height, n_cols, n_rows, exposure, *, frame="camera",
+                serpentine=True, pb=None, md=None):
+    """Serpentine raster around the current gonio position with pb_vector.
+
+    All rows are computed up front (raster_segments) and run as one
+    PowerBrickVector program, so the next row is set up while the current
+    one is exposed. One event per row is collected from the flyer.
+    """
+    pb = pb or pb_vector
+    omega = gonio.o.position
+    origin = (gonio.gx.position, gonio.py.position, gonio.pz.position)
+    program = raster_segments(
+        width, height, n_cols, n_rows, exposure, omega=omega, origin=origin,
+        frame=frame, serpentine=serpentine)
+
+    _md = {"plan_name": "raster_scan", "width": width, "height": height,
+           "n_cols": n_cols, "n_rows": n_rows, "exposure": exposure,
+           "frame": frame, "serpentine": serpentine, "omega": omega}
+    _md.update(md or {})
+
+    @bpp.run_decorator(md=_md)
+    def inner():
+        pb.load_program(program)
+        yield from bps.kickoff(pb, wait=True)
+        yield from bps.complete(pb, wait=True)
+        yield from bps.collect(pb)
+
+    def cleanup():
+        pb.load_program(None)
+        yield from bps.null()
+
+    return (yield from bpp.finalize_wrapper(inner(), cleanup()))
+
+
+def bench_raster(width=100.0, height=100.0, n_cols=50, n_rows=20,
+                 exposure=2.0, latency=0.01, speed=1000.0):
+    """Rows per second and per-row overhead of a raster on a simulated
+    PowerBrick: naive row-by-row (same direction every row, setpoints put
+    one by one, kickoff/complete per row) against the serpentine program.
+    """
+    from sim_devices import SimCASignal
+
+    SimCASignal.latency = latency
+    row_time = n_cols * exposure / 1000
+    results = {}
+
+    pb = sim_powerbrick_vector(name="sim_pb", speed=speed)
+    naive = raster_segments(width, height, n_cols, n_rows, exposure,
+                            serpentine=False)
+    t0 = ttime.time()
+    for segment in naive:
+        for sig, value in pb._segment_pairs(segment):
+            sig.put(value, wait=True)
+        pb.kickoff().wait()
+        pb.complete().wait()
+    results["naive"] = ttime.time() - t0
+
+    pb = sim_powerbrick_vector(name="sim_pb", speed=speed)
+    pb.load_program(raster_segments(width, height, n_cols, n_rows, exposure))
+    t0 = ttime.time()
+    pb.kickoff().wait()
+    pb.complete().wait()
+    results["serpentine"] = ttime.time() - t0
+
+    for key in ("naive", "serpentine"):
+        elapsed = results[key]
+        results[f"{key}_rows_per_s"] = n_rows / elapsed
+        results[f"{key}_overhead_per_row"] = elapsed / n_rows - row_time
+        print(f"{key:>10}: {n_rows} rows in {elapsed:.2f} s, "
+              f"{n_rows / elapsed:.1f} rows/s, "
+              f"{(elapsed / n_rows - row_time) * 1e3:.0f} ms overhead/row")
+    return results
@@ -244,11 +244,11 @@ def rot_pin_align(
            'plan_group_id': str(uuid.uuid4()),
            'alignment_pin': pin}
 
-    if gov_rbt.state.get() == 'M':
+    if gov_rbt_client.state == 'M':
         print('found governor in M, awaiting sentinel recovery')
-        yield from bps.sleep(15)
+        yield from wait_status(gov_rbt_client.left_moving(timeout=60))
 
-    yield from bps.abs_set(gov_rbt, 'PA', wait=True)
+    yield from bps.abs_set(gov_rbt_client, 'PA', wait=True)
 
     # deactivate govmon before alignment
     yield from bps.mv(goniomon, 0, settle_time=1)
@@ -427,11 +427,12 @@ def rot_pin_align_with_robot(pin='pin_7', timeout=100000):
     yield from bps.abs_set(gov_rbt, "SE", wait=True)
 
     print(f"mounting alignment {pin}")
-    robrob.mount_special(general_puck_pos, timeout)
+    yield from robot_plan(robrob, "mount_special", general_puck_pos, timeout)
     yield from bps.abs_set(gov_rbt, "PA", wait=True)
     yield from rot_pin_align(start=st)
     yield from bps.abs_set(gov_rbt, "SE", wait=True)
-    robrob.unmount_special(general_puck_pos, timeout)
+    yield from robot_plan(robrob, "unmount_special", general_puck_pos,
+                          timeout)
 
 
 def compare_plans():
@@ -6,7 +6,7 @@ Created on Tue Oct 22 15:59:31 2024
 @author: xf17id1
 """
 
-from ophyd.utils.errors import StatusTimeoutError
+from bluesky.utils import FailedStatus
 
 
 @reset_positions_decorator([govmon, goniomon])
@@ -18,31 +18,18 @@ def home_pins():
         settle_time=1,
     )
 
-    yield from bps.mv(
-        pyz_homer.kill_py, 1,
-        pyz_homer.kill_pz, 1,
-        settle_time=1,
-    )
+    yield from wait_status(pyz_homer.kill_pins())
 
     yield from bps.mv(gonio.o, 90)
 
     try:
         yield from bp.count([pyz_homer], 1)
 
-    except StatusTimeoutError as e:
+    except FailedStatus as e:
         print(f'Caught {e} during pinYZ home attempt, retrying')
+        print(pyz_homer.diagnostics())
 
-        # kill 2x
-        yield from bps.mv(
-            pyz_homer.kill_py, 1,
-            pyz_homer.kill_pz, 1,
-            settle_time=1,
-        )
-        yield from bps.mv(
-            pyz_homer.kill_py, 1,
-            pyz_homer.kill_pz, 1,
-            settle_time=1,
-        )
+        yield from wait_status(pyz_homer.kill_pins())
         yield from bp.count([pyz_homer, gonio.o], 1)
 
     yield from bps.mv(gonio.o, 0)
@@ -58,7 +45,8 @@ def test_home_pins(n):
     for k in range(n):
         yield from bps.abs_set(gov_rbt, 'SE', wait=True)
         print(f'running test {k+1} of {n}')
-        robrob.mount_special(6, 1000000)
+        yield from robot_plan(robrob, 'mount_special', 6, 1000000)
         yield from home_pins()
         yield from bps.abs_set(gov_rbt, 'SE', wait=True)
-        robrob.unmount_special(6, 1000000)
+        yield from robot_plan(robrob, 'unmount_special', 6, 1000000)
+    print(pyz_homer.homing_stats())
@@ -295,8 +295,8 @@ def topview_optimized():
         print(f"Error: {error}")
         print("arming problem during coarse alignment...trying again")
 
-        yield from bps.sleep(15)
-        yield from bps.abs_set(gov_rbt, 'SE', wait=True)
+        yield from wait_status(gov_rbt_client.left_moving(timeout=60))
+        yield from bps.abs_set(gov_rbt_client, 'SE', wait=True)
         yield from bps.abs_set(top_aligner_fast.zebra.reset, 1, wait=True)
         yield from bps.sleep(4)  # 2-3 sec will disarm zebra after reset
 
@@ -329,7 +329,7 @@ def topview_optimized():
     except (FailedStatus, WaitTimeoutError, GovernorError) as error:
         print(f"Error: {error}")
         print("arming problem during fine alignment...trying again")
-        yield from bps.sleep(15)
+        yield from wait_status(gov_rbt_client.left_moving(timeout=60))
         # update work positions for TA reset
         yield from bps.abs_set(work_pos.o, 180, wait=True)
         yield from bps.abs_set(
@@ -338,7 +338,7 @@ def topview_optimized():
         yield from bps.abs_set(
             work_pos.pz, mount_pos.pz.get(), wait=True
         )
-        yield from bps.abs_set(gov_rbt, 'TA', wait=True)
+        yield from bps.abs_set(gov_rbt_client, 'TA', wait=True)
         yield from bps.abs_set(top_aligner_fast.zebra.reset, 1, wait=True)
 
         # update work positions for TA -> SA retry